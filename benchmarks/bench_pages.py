@@ -0,0 +1,83 @@
+"""Benchmark das páginas do dashboard: tempo até o primeiro render e latência de rerun.
+
+Cada página roda em um processo novo (imports a frio) com o AppTest do Streamlit.
+Mede a importação do script, o primeiro run completo e os reruns após mudar o
+filtro de cidades. Os dados processados em disco são reaproveitados (cache do ETL).
+
+Uso (a partir da raiz do repositório, com data/raw/curry_company_dataset.csv):
+    python -m benchmarks.bench_pages --reruns 5 --output pages.json
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PAGES = ['pages/01_Empresa.py', 'pages/02_Entregadores.py', 'pages/03_Restaurantes.py']
+
+def measure_page(page, reruns):
+    """Tempos de uma página no processo atual (chamado no processo filho)."""
+    import logging
+    logging.disable(logging.WARNING)
+
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    import_seconds = time.perf_counter() - start
+
+    at = AppTest.from_file(page, default_timeout=600)
+    start = time.perf_counter()
+    at.run()
+    first_run = time.perf_counter() - start
+    if at.exception:
+        raise SystemExit(f"{page}: {[e.value for e in at.exception]}")
+
+    # Cada rerun usa uma seleção de cidades ainda não vista (sem acerto no cache de resultados)
+    options = list(at.sidebar.multiselect(key='filter_cities').options)
+    selections = [list(c) for k in range(len(options) - 1, 0, -1) for c in itertools.combinations(options, k)]
+    rerun_times = []
+    for i in range(reruns):
+        start = time.perf_counter()
+        at.sidebar.multiselect(key='filter_cities').set_value(selections[i % len(selections)]).run()
+        rerun_times.append(time.perf_counter() - start)
+
+    return {
+        'page': page,
+        'streamlit_import_seconds': import_seconds,
+        'first_run_seconds': first_run,
+        'rerun_median_seconds': statistics.median(rerun_times) if rerun_times else None,
+        'rerun_seconds': rerun_times,
+        'loaded_modules': sorted(m for m in ('plotly', 'folium', 'streamlit_folium') if m in sys.modules),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reruns', type=int, default=5)
+    parser.add_argument('--output', help='grava os resultados em JSON')
+    parser.add_argument('--page', help=argparse.SUPPRESS) # Modo processo filho
+    args = parser.parse_args()
+
+    if args.page:
+        print(json.dumps(measure_page(args.page, args.reruns)))
+        return
+
+    results = []
+    for page in PAGES:
+        # Processo novo por página: inclui o custo dos imports no primeiro render
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_pages', '--page', page,
+                              '--reruns', str(args.reruns)], capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result['process_seconds'] = time.perf_counter() - start
+        results.append(result)
+        print(f"{os.path.basename(page):<22} primeiro run {result['first_run_seconds']:.2f}s  "
+              f"rerun (mediana) {result['rerun_median_seconds']:.3f}s  módulos: {result['loaded_modules']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark do transform paralelo: tempo e speedup em função do número de workers.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_parallel_transform data/raw/curry_company_dataset.csv --workers 1 2 4 8
+"""
+import argparse
+import os
+import time
+
+from src.data_processing import extract, transform, transform_parallel
+
+def time_call(func, repeat):
+    """Melhor tempo (s) entre `repeat` execuções."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('raw_path', help='CSV bruto no schema da Curry Company')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df_raw = extract(args.raw_path)
+    if df_raw is None:
+        raise SystemExit(f"Arquivo não encontrado: {args.raw_path}")
+
+    serial = time_call(lambda: transform(df_raw), args.repeat)
+    print(f"{len(df_raw)} linhas, {os.cpu_count()} núcleos disponíveis")
+    print(f"{'workers':>8} {'tempo (s)':>10} {'speedup':>8}")
+    print(f"{'serial':>8} {serial:>10.3f} {1.0:>8.2f}")
+    for workers in sorted(set(args.workers)):
+        elapsed = time_call(lambda: transform_parallel(df_raw, workers=workers), args.repeat)
+        print(f"{workers:>8} {elapsed:>10.3f} {serial / elapsed:>8.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Paridade entre os backends de agregação: pandas (em memória) e DuckDB (SQL sobre Parquet).
+
+Para cada preset de filtros (e alguns filtros extras), calcula todos os itens
+das três páginas e o mapa de densidade nos dois backends e compara os números:
+métricas, tabelas, dados dos traços dos gráficos e marcadores/células dos mapas.
+A ordem das linhas não importa (o pandas ordena categorias, o SQL ordena texto).
+Sai com código 1 se algum item divergir.
+
+Uso (a partir da raiz do repositório, com data/raw/curry_company_dataset.csv e duckdb
+instalado via requirements-duckdb.txt):
+    python -m benchmarks.check_backend_parity --rtol 1e-6
+"""
+import argparse
+import logging
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.query_backend import select_filtered, is_selection
+from src.result_cache import get_result_cache
+from src.snapshots import FILTER_PRESETS, PAGE_ITEMS, resolve_preset, compute_page_items
+from src.utils import load_dashboard_data, filter_in_memory, FILTER_COLUMNS
+from src.visualizations import bin_coordinates, density_cell_size, DENSITY_POINTS, DENSITY_DEFAULT_ZOOM
+
+# Filtros além dos presets: período curto, seleção vazia e valores ausentes
+EXTRA_FILTERS = {
+    'uma_semana': {'date_range': ['2022-03-01', '2022-03-07']},
+    'sem_cidades': {'cities': []},
+    # Os valores de veículo têm espaço no fim; 'NaN' é o marcador de clima ausente dos dados brutos
+    'tempestade_moto': {'weather': ['Stormy', 'Sandstorms', 'NaN'], 'vehicle': ['motorcycle ']},
+}
+DENSITY_ZOOMS = [DENSITY_DEFAULT_ZOOM, 8]
+# Chaves dos traços plotly comparadas (as que existirem em cada traço)
+TRACE_KEYS = ('x', 'y', 'values', 'labels', 'ids', 'parents', 'width', 'customdata')
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+def _rows(columns):
+    """Linhas (tuplas) ordenadas a partir de colunas paralelas; números viram float."""
+    rows = [tuple(float(v) if _is_number(v) else str(v) for v in row) for row in zip(*columns)]
+    return sorted(rows, key=lambda row: tuple((isinstance(v, float), v) for v in row))
+
+def _close_rows(a, b, rtol):
+    """Diferença relativa máxima entre duas listas de linhas; None se a forma ou o texto diferir."""
+    if len(a) != len(b):
+        return None
+    worst = 0.0
+    for row_a, row_b in zip(a, b):
+        if len(row_a) != len(row_b):
+            return None
+        for x, y in zip(row_a, row_b):
+            if isinstance(x, float) and isinstance(y, float):
+                if math.isnan(x) and math.isnan(y):
+                    continue
+                diff = abs(x - y) / max(abs(x), abs(y), 1e-12)
+                if math.isnan(diff):
+                    return None
+                worst = max(worst, diff)
+            elif x != y:
+                return None
+    return worst
+
+def _frame_rows(df):
+    df = df.reset_index() if df.index.name or isinstance(df.index, pd.MultiIndex) else df
+    df = df[sorted(df.columns, key=str)]
+    return _rows([df[col].astype(object).where(df[col].notna(), np.nan).tolist() for col in df.columns])
+
+def _figure_rows(fig):
+    """Dados dos traços de um gráfico plotly, por nome de traço."""
+    traces = {}
+    for trace in fig.data:
+        data = trace.to_plotly_json()
+        columns = []
+        for key in TRACE_KEYS:
+            value = data.get(key)
+            if value is None:
+                continue
+            value = np.asarray(value, dtype=object)
+            if value.ndim == 2:
+                columns.extend(value.T.tolist())
+            elif value.ndim == 1:
+                columns.append(value.tolist())
+        traces[str(data.get('name'))] = _rows(columns)
+    return traces
+
+def _map_rows(map_obj):
+    """Localizações e textos dos marcadores de um mapa folium."""
+    markers = []
+
+    def walk(element):
+        for child in element._children.values():
+            if hasattr(child, 'location') and type(child).__name__ == 'Marker':
+                markers.append(tuple(child.location) + (child.options.get('tooltip', ''),))
+            walk(child)
+    walk(map_obj)
+    return _rows(list(zip(*markers))) if markers else []
+
+def compare(a, b, rtol, error=0.0):
+    """Diferença relativa máxima entre dois resultados; None se divergirem."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        if a.keys() != b.keys():
+            return None
+        errors = a.get('Erro Relativo', {})
+        worst = 0.0
+        for key in a:
+            if key == 'Erro Relativo':
+                continue
+            # Contagens por HyperLogLog no pandas: a diferença pode chegar ao erro da estimativa
+            diff = compare(a[key], b[key], rtol, errors.get(key, 0.0))
+            if diff is None:
+                return None
+            worst = max(worst, diff)
+        return worst
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        diffs = [compare(x, y, rtol) for x, y in zip(a, b)]
+        return None if len(a) != len(b) or None in diffs else max(diffs, default=0.0)
+    if isinstance(a, pd.DataFrame):
+        diff = _close_rows(_frame_rows(a), _frame_rows(b), rtol)
+    elif hasattr(a, 'to_plotly_json'):
+        rows_a, rows_b = _figure_rows(a), _figure_rows(b)
+        if rows_a.keys() != rows_b.keys():
+            return None
+        diffs = [_close_rows(rows_a[name], rows_b[name], rtol) for name in rows_a]
+        diff = None if None in diffs else max(diffs, default=0.0)
+    elif type(a).__name__ == 'Map':
+        diff = _close_rows(_map_rows(a), _map_rows(b), rtol)
+    else:
+        diff = _close_rows(_rows([[a]]), _rows([[b]]), rtol)
+    if diff is None or diff > max(rtol, 3 * error):
+        return None
+    return diff
+
+def density_items(filtered):
+    """Células do mapa de densidade (os dois tipos de ponto) em cada zoom testado."""
+    return {f'{points}@{zoom}': bin_coordinates(filtered['orders'], points, density_cell_size(zoom))
+            for zoom in DENSITY_ZOOMS for points in DENSITY_POINTS}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rtol', type=float, default=1e-6, help='diferença relativa máxima aceita')
+    args = parser.parse_args()
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    data = load_dashboard_data()
+    if data is None:
+        raise SystemExit("Dados brutos não encontrados.")
+    if not data['parquet_files']:
+        raise SystemExit("Nenhum Parquet processado para o backend SQL.")
+
+    failures = []
+    seconds = {'pandas': 0.0, 'duckdb': 0.0}
+    for name, overrides in {**FILTER_PRESETS, **EXTRA_FILTERS}.items():
+        filters = resolve_preset(data['filter_index'], overrides)
+        results = {}
+        for backend in seconds:
+            # Cache de resultados vazio: cada backend calcula os próprios itens
+            get_result_cache().clear()
+            start = time.perf_counter()
+            if backend == 'pandas':
+                # Índices em memória mesmo com CURRY_QUERY_BACKEND=duckdb
+                filtered = filter_in_memory(data, filters)
+            else:
+                filtered = select_filtered(data['parquet_files'], data['dataset_version'], filters, FILTER_COLUMNS)
+            if is_selection(filtered['orders']) != (backend == 'duckdb'):
+                raise SystemExit(f"O lado '{backend}' não usou o backend esperado: a comparação não vale.")
+            try:
+                items = compute_page_items(filtered)
+                items['Mapa de densidade'] = density_items(filtered)
+            except (ValueError, IndexError, KeyError) as e:
+                # Seleções vazias: o item falha nos dois backends (comparado abaixo pelo tipo do erro)
+                items = {'erro': type(e).__name__}
+            seconds[backend] += time.perf_counter() - start
+            results[backend] = items
+
+        pandas_items, sql_items = results['pandas'], results['duckdb']
+        if 'erro' in pandas_items or 'erro' in sql_items:
+            status = 'ok' if pandas_items == sql_items else 'DIVERGE'
+            print(f"{name:<18} {status} (seleção vazia: {pandas_items.get('erro')} / {sql_items.get('erro')})")
+            if status != 'ok':
+                failures.append((name, 'erro'))
+            continue
+        worst = 0.0
+        for page in list(PAGE_ITEMS) + ['Mapa de densidade']:
+            for item in pandas_items[page]:
+                diff = compare(pandas_items[page][item], sql_items[page][item], args.rtol)
+                if diff is None:
+                    failures.append((name, f'{page}.{item}'))
+                    print(f"  {name}: {page}.{item} diverge")
+                else:
+                    worst = max(worst, diff)
+        print(f"{name:<18} diferença relativa máxima {worst:.2e}")
+
+    print(f"Tempo total: pandas {seconds['pandas']:.2f}s, duckdb {seconds['duckdb']:.2f}s")
+    if failures:
+        raise SystemExit(f"{len(failures)} itens divergentes")
+
+if __name__ == '__main__':
+    main()
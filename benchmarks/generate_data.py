@@ -0,0 +1,145 @@
+"""Gera CSVs sintéticos no schema bruto da Curry Company, com os mesmos valores sujos.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.generate_data data/raw/curry_company_dataset.csv --rows 100000
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Colunas do CSV bruto, na ordem do dataset original
+RAW_COLUMNS = [
+    'ID', 'Delivery_person_ID', 'Delivery_person_Age', 'Delivery_person_Ratings',
+    'Restaurant_latitude', 'Restaurant_longitude', 'Delivery_location_latitude',
+    'Delivery_location_longitude', 'Order_Date', 'Time_Orderd', 'Time_Order_picked',
+    'Weatherconditions', 'Road_traffic_density', 'Vehicle_condition', 'Type_of_order',
+    'Type_of_vehicle', 'multiple_deliveries', 'Festival', 'City', 'Time_taken(min)',
+]
+# Período coberto pelo dataset original
+FIRST_DATE = '2022-02-11'
+N_DAYS = 55
+# Linhas geradas por bloco ao gravar (limita a memória para 10M+ linhas)
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+CITY_PREFIXES = ['INDO', 'BANG', 'CHEN', 'MUM', 'HYD', 'JAP', 'RANCHI', 'COIMB', 'SUR', 'PUNE']
+WEATHER = ['Sunny', 'Stormy', 'Sandstorms', 'Cloudy', 'Fog', 'Windy']
+TRAFFIC = ['Low', 'Medium', 'High', 'Jam']
+ORDER_TYPES = ['Snack', 'Meal', 'Drinks', 'Buffet']
+VEHICLES = ['motorcycle', 'scooter', 'electric_scooter', 'bicycle']
+CITIES = ['Metropolitian', 'Urban', 'Semi-Urban']
+
+def _pick(rng, table, n, p=None):
+    """Sorteia n valores de uma tabela de strings (indexação vetorizada)."""
+    table = np.asarray(table, dtype=object)
+    return table[rng.choice(len(table), size=n, p=p)]
+
+def _with_nans(rng, values, rate):
+    """Substitui uma fração `rate` dos valores pela string suja 'NaN '."""
+    values[rng.random(len(values)) < rate] = 'NaN '
+    return values
+
+def generate_orders(n_rows, seed=0, start_id=0):
+    """DataFrame bruto com n_rows pedidos sintéticos (valores sujos como no dataset real)."""
+    rng = np.random.default_rng(seed)
+    n = n_rows
+
+    # ID único em hexadecimal, como '0x4607 '
+    ids = pd.Series(np.arange(start_id, start_id + n) + 0x4607).map('0x{:x} '.format).to_numpy(dtype=object)
+
+    # Entregador: <cidade>RES<restaurante>DEL<entregador>, com espaço final
+    couriers = np.array([f'{c}RES{r:02d}DEL{d:02d} ' for c in CITY_PREFIXES
+                         for r in range(1, 21) for d in range(1, 4)], dtype=object)
+    courier_idx = rng.integers(0, len(couriers), n)
+
+    # Idade e avaliação fixas por entregador (com ruído e 'NaN ' ocasionais)
+    courier_age = rng.integers(20, 40, len(couriers))
+    courier_rating = rng.uniform(3.5, 5.0, len(couriers))
+    ages = _with_nans(rng, (courier_age[courier_idx] + rng.integers(-2, 3, n)).astype(str).astype(object), 0.04)
+    ratings = np.round(np.clip(courier_rating[courier_idx] + rng.normal(0, 0.2, n), 1, 6), 1)
+    ratings = _with_nans(rng, ratings.astype(str).astype(object), 0.04)
+
+    # Coordenadas: algumas latitudes negativas e zeros, como no dataset original
+    rest_lat = rng.uniform(10, 31, n)
+    rest_lon = rng.uniform(72, 89, n)
+    rest_lat[rng.random(n) < 0.05] *= -1
+    zero = rng.random(n) < 0.01
+    rest_lat[zero] = 0.0
+    rest_lon[zero] = 0.0
+    deliv_lat = np.abs(rest_lat) + rng.uniform(0.01, 0.2, n)
+    deliv_lon = np.abs(rest_lon) + rng.uniform(0.01, 0.2, n)
+
+    # Datas dd-mm-yyyy e horários HH:MM:SS (o pedido pode cruzar a meia-noite)
+    dates = (pd.Timestamp(FIRST_DATE) + pd.to_timedelta(np.arange(N_DAYS), 'D')).strftime('%d-%m-%Y')
+    order_dates = np.asarray(dates, dtype=object)[rng.integers(0, N_DAYS, n)]
+    clock = np.array([f'{m // 60:02d}:{m % 60:02d}:00' for m in range(1440)], dtype=object)
+    ordered_min = rng.integers(8 * 60, 24 * 60, n)
+    picked_min = (ordered_min + rng.choice([5, 10, 15], n)) % 1440
+    time_ordered = _with_nans(rng, clock[ordered_min], 0.04)
+    time_picked = clock[picked_min]
+
+    weather = _pick(rng, ['conditions ' + w for w in WEATHER] + ['conditions NaN'], n,
+                    p=[0.16] * 6 + [0.04])
+    traffic = _with_nans(rng, _pick(rng, [t + ' ' for t in TRAFFIC], n), 0.02)
+    vehicle_condition = rng.integers(0, 4, n)
+    order_type = _pick(rng, [o + ' ' for o in ORDER_TYPES], n)
+    vehicle = _pick(rng, [v + ' ' for v in VEHICLES], n, p=[0.58, 0.33, 0.08, 0.01])
+    multiple = _with_nans(rng, _pick(rng, ['0', '1', '2', '3'], n, p=[0.31, 0.62, 0.04, 0.03]), 0.02)
+    festival = _with_nans(rng, _pick(rng, ['No ', 'Yes '], n, p=[0.98, 0.02]), 0.005)
+    city = _with_nans(rng, _pick(rng, [c + ' ' for c in CITIES], n, p=[0.75, 0.22, 0.03]), 0.03)
+
+    # Tempo de entrega no formato sujo '(min) 24'
+    minutes = np.clip(rng.normal(26, 9, n).round(), 10, 54).astype('int64')
+    time_taken = np.array([f'(min) {m}' for m in range(10, 55)], dtype=object)[minutes - 10]
+
+    return pd.DataFrame({
+        'ID': ids,
+        'Delivery_person_ID': couriers[courier_idx],
+        'Delivery_person_Age': ages,
+        'Delivery_person_Ratings': ratings,
+        'Restaurant_latitude': rest_lat.round(6),
+        'Restaurant_longitude': rest_lon.round(6),
+        'Delivery_location_latitude': deliv_lat.round(6),
+        'Delivery_location_longitude': deliv_lon.round(6),
+        'Order_Date': order_dates,
+        'Time_Orderd': time_ordered,
+        'Time_Order_picked': time_picked,
+        'Weatherconditions': weather,
+        'Road_traffic_density': traffic,
+        'Vehicle_condition': vehicle_condition,
+        'Type_of_order': order_type,
+        'Type_of_vehicle': vehicle,
+        'multiple_deliveries': multiple,
+        'Festival': festival,
+        'City': city,
+        'Time_taken(min)': time_taken,
+    }, columns=RAW_COLUMNS)
+
+def write_raw_csv(path, n_rows, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Grava o CSV bruto em blocos; cada bloco usa uma semente derivada de `seed`."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    written = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        for i, start in enumerate(range(0, n_rows, chunk_rows)):
+            size = min(chunk_rows, n_rows - start)
+            chunk = generate_orders(size, seed=[seed, i], start_id=start)
+            chunk.to_csv(f, index=False, header=(i == 0))
+            written += size
+    os.replace(tmp_path, path)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', help='caminho do CSV a gerar')
+    parser.add_argument('--rows', type=int, default=45_593, help='número de pedidos (padrão: tamanho do dataset original)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    written = write_raw_csv(args.output, args.rows, seed=args.seed, chunk_rows=args.chunk_rows)
+    print(f"{written} linhas gravadas em {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Benchmark do ETL e das funções do dashboard em vários tamanhos de dataset.
+
+Para cada tamanho, gera (ou reaproveita) um CSV sintético e mede tempo e pico de
+memória de extract, transform, load, build_filter_index, apply_filters e de cada
+função pública de src/visualizations.py, com os bytes enviados ao navegador por
+gráfico ou mapa. Os resultados vão para um JSON.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.run_benchmarks --sizes 10000 100000 1000000 --output bench.json
+"""
+import argparse
+import datetime
+import inspect
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generate_data import write_raw_csv
+from src import visualizations
+from src.data_processing import extract, transform, load
+from src.utils import build_filter_index, apply_filters
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+# Argumentos extras das funções de visualização que não recebem só o DataFrame
+EXTRA_ARGS = {
+    'plot_time_percentiles': {'by': 'City'},
+    'bin_coordinates': {'points': 'delivery', 'cell_deg': visualizations.density_cell_size(visualizations.DENSITY_DEFAULT_ZOOM)},
+}
+
+def visualization_functions():
+    """Funções públicas de src/visualizations.py cujo primeiro argumento é o DataFrame."""
+    functions = {}
+    for name, func in inspect.getmembers(visualizations, inspect.isfunction):
+        if name.startswith('_') or func.__module__ != visualizations.__name__:
+            continue
+        params = list(inspect.signature(func).parameters)
+        if params and params[0] == 'df':
+            functions[name] = func
+    return functions
+
+def measure(func, repeat):
+    """Melhor tempo (s) entre `repeat` execuções e o pico de memória (bytes) de uma execução extra.
+
+    O pico é medido com tracemalloc numa execução separada, para não distorcer o tempo;
+    ele cobre as alocações do Python e do NumPy/pandas, mas não os buffers internos do Arrow.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    del result
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def payload_bytes(value):
+    """Bytes enviados ao navegador: JSON da figura Plotly ou HTML do mapa folium (None se não for gráfico)."""
+    if isinstance(value, tuple):
+        sizes = [payload_bytes(v) for v in value]
+        return sum(sizes) if any(size is not None for size in sizes) else None
+    if hasattr(value, 'to_plotly_json'):
+        return len(value.to_json().encode('utf-8'))
+    if hasattr(value, 'get_root'):
+        return len(value.get_root().render().encode('utf-8'))
+    return None
+
+def typical_filters(df):
+    """Seleção típica da barra lateral: metade central do período e um valor a menos por dimensão."""
+    dates = df['Order_Date'].dropna().sort_values()
+    start = dates.iloc[len(dates) // 4].date()
+    end = dates.iloc[3 * len(dates) // 4].date()
+
+    def values(col):
+        options = sorted(v for v in df[col].dropna().unique() if v != 'NaN')
+        return options[:-1] if len(options) > 1 else options
+
+    return {
+        'date_range': (start, end),
+        'traffic': values('Road_traffic_density'),
+        'weather': values('Weatherconditions'),
+        'vehicle': values('Type_of_vehicle'),
+        'cities': values('City'),
+    }
+
+def bench_size(n_rows, data_dir, repeat, seed):
+    """Resultados de todas as etapas para um tamanho de dataset."""
+    raw_path = os.path.join(data_dir, f'raw_{n_rows}.csv')
+    if not os.path.exists(raw_path):
+        write_raw_csv(raw_path, n_rows, seed=seed)
+
+    results = []
+
+    def record(step, func, rows, payload=False):
+        seconds, peak = measure(func, repeat)
+        result = {'rows': n_rows, 'step': step, 'input_rows': rows,
+                  'seconds': seconds, 'peak_bytes': peak}
+        line = f"{n_rows:>10} {step:<55} {seconds:>9.4f}s {peak / 2**20:>9.1f} MiB"
+        if payload:
+            result['payload_bytes'] = payload_bytes(func())
+            if result['payload_bytes'] is not None:
+                line += f" {result['payload_bytes'] / 1024:>9.1f} KiB enviados"
+        results.append(result)
+        print(line)
+
+    record('extract', lambda: extract(raw_path), n_rows)
+    df_raw = extract(raw_path)
+    record('transform', lambda: transform(df_raw), len(df_raw))
+    df = transform(df_raw)
+    del df_raw
+
+    output_path = os.path.join(data_dir, f'processed_{n_rows}.parquet')
+    record('load', lambda: load(df, output_path), len(df))
+
+    filters = typical_filters(df)
+    record('build_filter_index', lambda: build_filter_index(df), len(df))
+    index = build_filter_index(df)
+    record('apply_filters', lambda: apply_filters(df, **filters), len(df))
+    record('apply_filters[index]', lambda: apply_filters(index['df'], **filters, index=index), len(df))
+
+    # Funções do dashboard sobre a seleção filtrada (sem marcação: o cache de resultados não atua)
+    df_filtered = apply_filters(index['df'], **filters, index=index)
+    for name, func in visualization_functions().items():
+        kwargs = EXTRA_ARGS.get(name, {})
+        record(f'visualizations.{name}', lambda: func(df_filtered, **kwargs), len(df_filtered), payload=True)
+    return results
+
+def environment():
+    """Metadados da máquina e das bibliotecas, para comparar execuções."""
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='números de linhas do CSV bruto')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'curry_benchmarks'),
+                        help='diretório dos CSVs gerados (reaproveitados entre execuções)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    # O Streamlit avisa que não há sessão ativa a cada chamada; irrelevante aqui
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = []
+    for n_rows in args.sizes:
+        results.extend(bench_size(n_rows, args.data_dir, args.repeat, args.seed))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'sizes': args.sizes,
+                   'repeat': args.repeat, 'results': results}, f, indent=2)
+    print(f"Resultados gravados em {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,47 +1,54 @@
 import streamlit as st
 import pandas as pd
-from streamlit_folium import folium_static 
-from src.utils import setup_sidebar
-from src.data_processing import run_etl
+from src.utils import load_session_data, sidebar_filters, data_status, live_metrics
+from src.live_feed import LIVE_FEED_PATH
+from src.snapshots import page_results
+from src.diagnostics import start_rerun, finish_rerun, timed
 from src.visualizations import (
-    get_company_key_metrics, 
-    plot_orders_by_date, 
-    plot_traffic_order_share,
-    plot_traffic_order_city,
-    get_country_map, 
-    plot_order_types_distribution,
-    plot_time_by_order_type_and_traffic
+    distinct_label,
+    get_density_map,
+    density_view_from_map,
+    DENSITY_DEFAULT_ZOOM
 )
 
 st.set_page_config(page_title='Visão da Empresa', page_icon='📈', layout='wide')
+# Instrumentação do rerun (ativa com CURRY_DIAGNOSTICS=1)
+start_rerun('Empresa')
 
 # --- Fluxo de Processamento de Dados ---
-# Garante que o DataFrame seja carregado e processado apenas uma vez
-if 'df_processed' not in st.session_state:
-    df_clean = run_etl(
-        input_path='data/raw/curry_company_dataset.csv',
-        output_path='data/processed/curry_company_processed.csv'
-    )
-    if df_clean is None:
-        #st.error("Erro ao carregar ou processar os dados. Por favor, verifique os arquivos e caminhos.")
-        st.stop()
-    st.session_state['df_processed'] = df_clean
+# Dados carregados e processados uma única vez por processo, compartilhados entre as sessões
+data = load_session_data()
+if not data:
+    #st.error("Erro ao carregar ou processar os dados. Por favor, verifique os arquivos e caminhos.")
+    st.stop()
 
-df = st.session_state['df_processed']
+df = data['df_processed']
+filter_index = data['filter_index']
 
 # --- Configuração Barra Lateral e Aplicação Filtros ---
-df_filtered = setup_sidebar(df)
+filters = sidebar_filters(df, index=filter_index)
+# Data dos dados em uso e progresso da atualização em segundo plano
+data_status(data)
+# Itens da página: lidos do snapshot se os filtros coincidirem com um preset pré-calculado,
+# senão calculados sobre as seleções filtradas (cubo, sketches e pedidos)
+result = page_results('Empresa', data, filters)
 
 # --- Layout do Dashboard Streamlit ---
-metrics = get_company_key_metrics(df_filtered)
+# Métricas do feed ao vivo (CURRY_LIVE_FEED): atualizadas pelo próprio fragmento, sem rerun da página
+if LIVE_FEED_PATH:
+    live_metrics(filters)
+    st.markdown("---")
+
+metrics = result('metrics')
 
 # Exibe as métricas
 col1, col2, col3, col4, col5 = st.columns(5)
 
 with col1:
-    st.metric('Total Pedidos', metrics['Total Pedidos'])
+    st.metric(distinct_label('Total Pedidos', metrics['Erro Relativo']['Total Pedidos']), metrics['Total Pedidos'])
 with col2:
-    st.metric('Total Entregadores Únicos', metrics['Total Entregadores Únicos'])
+    st.metric(distinct_label('Total Entregadores Únicos', metrics['Erro Relativo']['Total Entregadores Únicos']),
+              metrics['Total Entregadores Únicos'])
 with col3:
     st.metric('Tempo Médio Entrega (min)', metrics['Tempo Médio de Entrega (min)'])
 with col4:
@@ -52,38 +59,70 @@ with col5:
 st.markdown("---") 
 
 # --- Seção de Análises Detalhadas ---
-tab1, tab2, tab3, tab4 = st.tabs([
-    "Visão Geral de Pedidos",
-    "Impacto do Tráfego",
-    "Mapa Geográfico",
-    "Análises de Tipo de Pedido"
-])
+# Só a análise selecionada é calculada e desenhada (st.tabs executaria todas a cada rerun)
+view = st.radio(
+    "Análise:",
+    [
+        "Visão Geral de Pedidos",
+        "Impacto do Tráfego",
+        "Mapa Geográfico",
+        "Análises de Tipo de Pedido"
+    ],
+    horizontal=True,
+    key='view_empresa',
+    label_visibility='collapsed'
+)
 
-with tab1:
+if view == "Visão Geral de Pedidos":
     st.subheader("Volume de Pedidos por Data")
-    fig_orders_by_date = plot_orders_by_date(df_filtered)
+    fig_orders_by_date = result('orders_by_date')
     st.plotly_chart(fig_orders_by_date, use_container_width=True)
-
-with tab2:
+elif view == "Impacto do Tráfego":
     st.subheader("Distribuição de Pedidos por Densidade de Tráfego")
-    fig_traffic_share = plot_traffic_order_share(df_filtered)
+    fig_traffic_share = result('traffic_share')
     st.plotly_chart(fig_traffic_share, use_container_width=True)
 
     st.subheader("Volume de Pedidos por Cidade e Densidade de Tráfego")
-    fig_traffic_city = plot_traffic_order_city(df_filtered)
+    fig_traffic_city = result('traffic_city')
     st.plotly_chart(fig_traffic_city, use_container_width=True)
+elif view == "Mapa Geográfico":
+    # Importado só quando o mapa é exibido (carrega folium e branca)
+    from streamlit_folium import folium_static, st_folium
 
-with tab3:
-    st.subheader("Localização Mediana das Entregas por Cidade e Tráfego")
-    st.info("Este mapa mostra a localização mediana das entregas, agrupadas por cidade e densidade de tráfego. Use o zoom e clique nos marcadores para mais detalhes.")
-    map_obj = get_country_map(df_filtered)
-    folium_static(map_obj, width=1024, height=600)
-
-with tab4:
+    map_mode = st.radio(
+        "Modo do mapa:",
+        ["Densidade de Entregas", "Medianas por Cidade e Tráfego"],
+        horizontal=True,
+        key='map_mode'
+    )
+    if map_mode == "Densidade de Entregas":
+        st.subheader("Densidade de Entregas e Restaurantes")
+        st.info("Todos os pedidos agregados em uma grade: a cor indica o número de pedidos em cada célula. Aproxime o zoom para ver células menores.")
+        # Vista atual do mapa (zoom, centro, limites), atualizada pelo retorno do st_folium
+        density_view = st.session_state.setdefault(
+            'density_view', {'zoom': DENSITY_DEFAULT_ZOOM, 'center': None, 'bounds': None}
+        )
+        new_view = density_view_from_map(density_view, st.session_state.get('density_map'))
+        if new_view is not None:
+            density_view.update(new_view)
+        map_obj = get_density_map(result('orders'), **density_view)
+        with timed('st_folium'):
+            st_folium(map_obj, width=1024, height=600, key='density_map',
+                      returned_objects=['zoom', 'center', 'bounds'])
+    else:
+        st.subheader("Localização Mediana das Entregas por Cidade e Tráfego")
+        st.info("Este mapa mostra a localização mediana das entregas, agrupadas por cidade e densidade de tráfego. Use o zoom e clique nos marcadores para mais detalhes.")
+        map_obj = result('country_map')
+        with timed('folium_static'):
+            folium_static(map_obj, width=1024, height=600)
+elif view == "Análises de Tipo de Pedido":
     st.subheader("Distribuição dos Tipos de Pedido")
-    fig_order_types_dist = plot_order_types_distribution(df_filtered)
+    fig_order_types_dist = result('order_types')
     st.plotly_chart(fig_order_types_dist, use_container_width=True)
 
     st.subheader("Tempo Médio de Entrega por Tipo de Pedido e Tráfego")
-    fig_time_order_traffic = plot_time_by_order_type_and_traffic(df_filtered)
-    st.plotly_chart(fig_time_order_traffic, use_container_width=True)
\ No newline at end of file
+    fig_time_order_traffic = result('time_by_order_type_and_traffic')
+    st.plotly_chart(fig_time_order_traffic, use_container_width=True)
+
+# --- Diagnóstico (barra lateral, se a instrumentação estiver ativa) ---
+finish_rerun()
\ No newline at end of file
@@ -1,39 +1,34 @@
 import streamlit as st
 import pandas as pd
-from src.utils import setup_sidebar
-from src.data_processing import run_etl
-from src.visualizations import (
-    get_delivery_key_metrics, 
-    get_delivery_rating_by_traffic, 
-    get_delivery_rating_by_weather, 
-    get_top_n_deliverers, 
-    plot_delivery_age_distribution, 
-    plot_delivery_ratings_distribution, 
-    plot_time_taken_by_vehicle_condition, 
-    plot_deliveries_by_age_group_and_city 
-)
+from src.utils import load_session_data, sidebar_filters, data_status
+from src.snapshots import page_results
+from src.diagnostics import start_rerun, finish_rerun
+from src.visualizations import get_deliverer_profile
 
 st.set_page_config(page_title='Visão de Entregadores', page_icon='🚚', layout='wide')
+# Instrumentação do rerun (ativa com CURRY_DIAGNOSTICS=1)
+start_rerun('Entregadores')
 
 # --- Fluxo de Processamento de Dados ---
-# Garante que o DataFrame seja carregado e processado apenas uma vez
-if 'df_processed' not in st.session_state:
-    df_clean = run_etl(
-        input_path='data/raw/curry_company_dataset.csv',
-        output_path='data/processed/curry_company_processed.csv'
-    )
-    if df_clean is None:
-        #st.error("Erro ao carregar ou processar os dados. Por favor, verifique os arquivos e caminhos.")
-        st.stop()
-    st.session_state['df_processed'] = df_clean
-
-df = st.session_state['df_processed']
+# Dados carregados e processados uma única vez por processo, compartilhados entre as sessões
+data = load_session_data()
+if not data:
+    #st.error("Erro ao carregar ou processar os dados. Por favor, verifique os arquivos e caminhos.")
+    st.stop()
+
+df = data['df_processed']
+filter_index = data['filter_index']
 
 # --- Configuração Barra Lateral e Aplicação Filtros ---
-df_filtered = setup_sidebar(df)
+filters = sidebar_filters(df, index=filter_index)
+# Data dos dados em uso e progresso da atualização em segundo plano
+data_status(data)
+# Itens da página: lidos do snapshot se os filtros coincidirem com um preset pré-calculado,
+# senão calculados sobre as seleções filtradas (cubo, sketches e pedidos)
+result = page_results('Entregadores', data, filters)
 
 # --- Layout do Dashboard Streamlit ---
-metrics = get_delivery_key_metrics(df_filtered)
+metrics = result('metrics')
 
 # Exibe as métricas
 col1, col2, col3, col4, col5 = st.columns(5)
@@ -52,45 +47,84 @@ with col5:
 st.markdown("---") 
 
 # --- Seção de Análises Detalhadas ---
-tab1, tab2, tab3, tab4 = st.tabs([
-    "Avaliações por Condição",
-    "Top/Piores Entregadores",
-    "Distribuições Demográficas e de Avaliação",
-    "Impacto da Frota e Demografia"
-])
-
-with tab1:
+# Só a análise selecionada é calculada e desenhada (st.tabs executaria todas a cada rerun)
+view = st.radio(
+    "Análise:",
+    [
+        "Avaliações por Condição",
+        "Top/Piores Entregadores",
+        "Distribuições Demográficas e de Avaliação",
+        "Impacto da Frota e Demografia",
+        "Perfil do Entregador"
+    ],
+    horizontal=True,
+    key='view_entregadores',
+    label_visibility='collapsed'
+)
+
+if view == "Avaliações por Condição":
     st.subheader("Avaliação Média por Densidade de Tráfego")
-    df_rating_traffic = get_delivery_rating_by_traffic(df_filtered)
+    df_rating_traffic = result('rating_by_traffic')
     st.dataframe(df_rating_traffic, use_container_width=True)
 
     st.subheader("Avaliação Média por Condição Climática")
-    df_rating_weather = get_delivery_rating_by_weather(df_filtered)
+    df_rating_weather = result('rating_by_weather')
     st.dataframe(df_rating_weather, use_container_width=True)
+elif view == "Top/Piores Entregadores":
+    # Mais rápidos e mais lentos saem da mesma seleção parcial
+    df_top_10_fastest, df_top_10_slowest = result('fastest_and_slowest')
 
-with tab2:
     st.subheader("Top 10 Entregadores Mais Rápidos por Cidade")
-    df_top_10_fastest = get_top_n_deliverers(df_filtered, top_n=10, ascending=True)
     st.dataframe(df_top_10_fastest, use_container_width=True)
 
     st.subheader("Top 10 Entregadores Mais Lentos por Cidade")
-    df_top_10_slowest = get_top_n_deliverers(df_filtered, top_n=10, ascending=False)
     st.dataframe(df_top_10_slowest, use_container_width=True)
-
-with tab3:
+elif view == "Distribuições Demográficas e de Avaliação":
     st.subheader("Distribuição da Idade dos Entregadores")
-    fig_age_dist = plot_delivery_age_distribution(df_filtered)
+    fig_age_dist = result('age_distribution')
     st.plotly_chart(fig_age_dist, use_container_width=True)
 
     st.subheader("Distribuição das Avaliações dos Entregadores")
-    fig_ratings_dist = plot_delivery_ratings_distribution(df_filtered)
+    fig_ratings_dist = result('ratings_distribution')
     st.plotly_chart(fig_ratings_dist, use_container_width=True)
-
-with tab4:
+elif view == "Impacto da Frota e Demografia":
     st.subheader("Tempo Médio de Entrega por Condição do Veículo")
-    fig_time_vehicle = plot_time_taken_by_vehicle_condition(df_filtered)
+    fig_time_vehicle = result('time_by_vehicle_condition')
     st.plotly_chart(fig_time_vehicle, use_container_width=True)
 
     st.subheader("Número de Entregadores Únicos por Faixa Etária e Cidade")
-    fig_age_group_city = plot_deliveries_by_age_group_and_city(df_filtered)
+    fig_age_group_city = result('age_group_and_city')
     st.plotly_chart(fig_age_group_city, use_container_width=True)
+elif view == "Perfil do Entregador":
+    st.subheader("Perfil do Entregador")
+    profiles = result('deliverer_profiles')
+    if profiles.empty:
+        st.info("Nenhum entregador no período e filtros selecionados.")
+    else:
+        deliverer_id = st.selectbox(
+            "Entregador:",
+            options=sorted(profiles.index),
+            key='profile_deliverer'
+        )
+        profile = get_deliverer_profile(profiles, deliverer_id)
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric('Pedidos', profile['Pedidos'])
+        with col2:
+            st.metric('Tempo Médio (min)', profile['Tempo Médio (min)'])
+        with col3:
+            st.metric('STD Tempo (min)', profile['STD Tempo (min)'])
+        with col4:
+            st.metric('Avaliação Média', profile['Avaliação Média'])
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Tempo Médio por Densidade de Tráfego**")
+            st.dataframe(profile['Road_traffic_density'], hide_index=True, use_container_width=True)
+        with col2:
+            st.markdown("**Tempo Médio por Condição Climática**")
+            st.dataframe(profile['Weatherconditions'], hide_index=True, use_container_width=True)
+
+# --- Diagnóstico (barra lateral, se a instrumentação estiver ativa) ---
+finish_rerun()
\ No newline at end of file
@@ -1,43 +1,40 @@
 import streamlit as st
 import pandas as pd
-from src.utils import setup_sidebar
-from src.data_processing import run_etl
-from src.visualizations import (
-    get_restaurant_key_metrics,
-    plot_avg_std_time_by_city,
-    get_avg_std_time_by_city_and_order_type,
-    plot_avg_std_time_by_city_and_traffic,
-    plot_distance_by_vehicle_type,
-    get_avg_rating_by_weather_condition
-)
+from src.utils import load_session_data, sidebar_filters, data_status
+from src.snapshots import page_results
+from src.diagnostics import start_rerun, finish_rerun
+from src.visualizations import distinct_label, PERCENTILE_DIMENSIONS
 
 st.set_page_config(page_title='Visão de Restaurantes', page_icon='🍽️', layout='wide')
+# Instrumentação do rerun (ativa com CURRY_DIAGNOSTICS=1)
+start_rerun('Restaurantes')
 
 # --- Fluxo de Processamento de Dados ---
-# Garante que o DataFrame seja carregado e processado apenas uma vez
-if 'df_processed' not in st.session_state:
-    df_clean = run_etl(
-        input_path='data/raw/curry_company_dataset.csv',
-        output_path='data/processed/curry_company_processed.csv'
-    )
-    if df_clean is None:
-        #st.error("Erro ao carregar ou processar os dados. Por favor, verifique os arquivos e caminhos.")
-        st.stop()
-    st.session_state['df_processed'] = df_clean
+# Dados carregados e processados uma única vez por processo, compartilhados entre as sessões
+data = load_session_data()
+if not data:
+    #st.error("Erro ao carregar ou processar os dados. Por favor, verifique os arquivos e caminhos.")
+    st.stop()
 
-df = st.session_state['df_processed']
+df = data['df_processed']
+filter_index = data['filter_index']
 
 # --- Configuração da Barra Lateral e Aplicação de Filtros ---
-df_filtered = setup_sidebar(df)
+filters = sidebar_filters(df, index=filter_index)
+# Data dos dados em uso e progresso da atualização em segundo plano
+data_status(data)
+# Itens da página: lidos do snapshot se os filtros coincidirem com um preset pré-calculado,
+# senão calculados sobre as seleções filtradas (cubo, sketches e pedidos)
+result = page_results('Restaurantes', data, filters)
 
 # --- Layout do Dashboard Streamlit ---
-metrics = get_restaurant_key_metrics(df_filtered)
+metrics = result('metrics')
 
 # Exibe as métricas
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    st.metric("Entregadores Únicos", metrics["Entregadores Únicos"])
+    st.metric(distinct_label("Entregadores Únicos", metrics['Erro Relativo']["Entregadores Únicos"]), metrics["Entregadores Únicos"])
 with col2:
     st.metric("Distância Média (km)", metrics["Distância Média (km)"])
 with col3:
@@ -48,33 +45,58 @@ with col4:
 st.markdown("---") 
 
 # --- Seção de Análises Detalhadas---
-tab1, tab2, tab3, tab4 = st.tabs([
-    "Tempo por Cidade e Tráfego",
-    "Tempo por Cidade e Tipo de Pedido",
-    "Distância por Veículo",
-    "Impacto do Clima"
-])
+# Só a análise selecionada é calculada e desenhada (st.tabs executaria todas a cada rerun)
+view = st.radio(
+    "Análise:",
+    [
+        "Tempo por Cidade e Tráfego",
+        "Tempo por Cidade e Tipo de Pedido",
+        "Distância por Veículo",
+        "Impacto do Clima",
+        "Percentis de Tempo (SLA)"
+    ],
+    horizontal=True,
+    key='view_restaurantes',
+    label_visibility='collapsed'
+)
 
-with tab1:
+if view == "Tempo por Cidade e Tráfego":
     st.subheader("Tempo Médio e STD por Cidade e Densidade de Tráfego")
-    fig_traffic_sunburst = plot_avg_std_time_by_city_and_traffic(df_filtered)
+    fig_traffic_sunburst = result('time_by_city_and_traffic')
     st.plotly_chart(fig_traffic_sunburst, use_container_width=True)
 
     st.subheader("Tempo Médio e STD de Entrega por Cidade (Geral)")
-    fig_avg_time_city = plot_avg_std_time_by_city(df_filtered)
+    fig_avg_time_city = result('time_by_city')
     st.plotly_chart(fig_avg_time_city, use_container_width=True)
-
-with tab2:
+elif view == "Tempo por Cidade e Tipo de Pedido":
     st.subheader("Tempo Médio e STD por Cidade e Tipo de Pedido")
-    df_time_order_type = get_avg_std_time_by_city_and_order_type(df_filtered)
+    df_time_order_type = result('time_by_city_and_order_type')
     st.dataframe(df_time_order_type, use_container_width=True)
-
-with tab3:
+elif view == "Distância por Veículo":
     st.subheader("Distância Média de Entrega por Tipo de Veículo")
-    fig_distance_vehicle = plot_distance_by_vehicle_type(df_filtered)
+    fig_distance_vehicle = result('distance_by_vehicle')
     st.plotly_chart(fig_distance_vehicle, use_container_width=True)
-
-with tab4:
+elif view == "Impacto do Clima":
     st.subheader("Avaliação de Entregadores por Condição Climática")
-    df_rating_weather = get_avg_rating_by_weather_condition(df_filtered)
+    df_rating_weather = result('rating_by_weather')
     st.dataframe(df_rating_weather, use_container_width=True)
+elif view == "Percentis de Tempo (SLA)":
+    st.subheader("Percentis do Tempo de Entrega")
+    df_percentiles = result('time_percentiles')
+    col1, col2, col3 = st.columns(3)
+    for col, p in zip((col1, col2, col3), ('p50', 'p90', 'p99')):
+        with col:
+            value = df_percentiles[p].iloc[0] if not df_percentiles.empty else "N/A"
+            st.metric(f"Tempo {p.upper()} (min)", value)
+
+    percentile_dimension = st.selectbox(
+        "Agrupar percentis por:",
+        options=list(PERCENTILE_DIMENSIONS),
+        format_func=PERCENTILE_DIMENSIONS.get,
+        key='percentile_dimension'
+    )
+    fig_percentiles = result(f'time_percentiles_by:{percentile_dimension}')
+    st.plotly_chart(fig_percentiles, use_container_width=True)
+
+# --- Diagnóstico (barra lateral, se a instrumentação estiver ativa) ---
+finish_rerun()
\ No newline at end of file
@@ -0,0 +1,288 @@
+import numpy as np
+import pandas as pd
+
+# === CUBO DE MÉTRICAS ===
+# Dimensões do cubo: incluem todas as dimensões filtradas na barra lateral
+CUBE_DIMENSIONS = ['Order_Date', 'City', 'Road_traffic_density', 'Weatherconditions',
+                   'Type_of_vehicle', 'Type_of_order', 'Festival', 'Vehicle_condition']
+# Medidas com estatísticas suficientes (contagem, soma e soma dos quadrados)
+CUBE_MEASURES = ['Time_taken(min)', 'Delivery_person_Ratings', 'distance_km']
+# Coluna com o número de pedidos de cada célula
+ORDERS_COLUMN = 'orders'
+
+def is_cube(df):
+    """Indica se o DataFrame é um cubo de métricas (e não o DataFrame de pedidos)."""
+    return ORDERS_COLUMN in df.columns
+
+def stat_columns(measure):
+    """Colunas de estatísticas suficientes de uma medida no cubo."""
+    return [f'{measure}|count', f'{measure}|sum', f'{measure}|sumsq']
+
+def build_metrics_cube(df, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES):
+    """Materializa o cubo: estatísticas aditivas por data e dimensões de negócio."""
+    values = {ORDERS_COLUMN: np.ones(len(df), dtype='int64')}
+    for measure in measures:
+        x = df[measure].to_numpy(dtype='float64', na_value=np.nan)
+        valid = ~np.isnan(x)
+        x = np.where(valid, x, 0.0)
+        values[f'{measure}|count'] = valid.astype('int64')
+        values[f'{measure}|sum'] = x
+        values[f'{measure}|sumsq'] = x * x
+
+    keys = [df[col] for col in dimensions]
+    cube = (pd.DataFrame(values, index=df.index)
+              .groupby(keys, observed=True, dropna=False, sort=True)
+              .sum()
+              .reset_index())
+    return cube
+
+def rollup(cube, by, measure):
+    """Consolida células do cubo: contagem, média e desvio padrão (amostral) por grupo."""
+    columns = stat_columns(measure)
+    if by:
+        stats = cube.groupby(by, observed=True)[columns].sum()
+    else:
+        stats = cube[columns].sum().to_frame().T
+
+    n = stats[columns[0]].to_numpy(dtype='float64')
+    total = stats[columns[1]].to_numpy(dtype='float64')
+    total_sq = stats[columns[2]].to_numpy(dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, total / n, np.nan)
+        var = np.where(n > 1, (total_sq - total * mean) / (n - 1), np.nan)
+    std = np.sqrt(np.clip(var, 0, None))
+
+    result = pd.DataFrame({'count': n.astype('int64'), 'mean': mean, 'std': std}, index=stats.index)
+    return result.reset_index() if by else result.reset_index(drop=True)
+
+def count_orders(cube, by):
+    """Número de pedidos por grupo a partir do cubo."""
+    return cube.groupby(by, observed=True)[ORDERS_COLUMN].sum()
+
+def merge_cells(frames, dimensions):
+    """Combina cubos (ou células por entregador) de vários lotes somando as estatísticas de cada célula."""
+    return (pd.concat(frames, ignore_index=True)
+              .groupby(dimensions, observed=True, dropna=False, sort=True)
+              .sum()
+              .reset_index())
+
+# === SELEÇÕES DE LINHAS ===
+# Resultado de um filtro sem cópia: o DataFrame compartilhado e as linhas selecionadas
+# (fatia ou array de posições). Cada consumidor materializa só as colunas que usa.
+SELECTION_ROWS = 'rows'
+
+def row_selection(frame, rows):
+    """Seleção das linhas `rows` (slice ou posições) de `frame`, sem copiar dados."""
+    return {'frame': frame, SELECTION_ROWS: rows}
+
+def is_row_selection(df):
+    """Indica se o argumento é uma seleção de linhas (e não um DataFrame)."""
+    return isinstance(df, dict) and SELECTION_ROWS in df
+
+def selection_frame(df):
+    """DataFrame de origem de uma seleção (o próprio DataFrame, se não for seleção)."""
+    return df['frame'] if is_row_selection(df) else df
+
+def row_count(df):
+    """Número de linhas de um DataFrame ou de uma seleção."""
+    if not is_row_selection(df):
+        return len(df)
+    rows = df[SELECTION_ROWS]
+    return len(range(len(df['frame']))[rows]) if isinstance(rows, slice) else len(rows)
+
+def take_columns(df, columns):
+    """Linhas selecionadas só com as colunas de `columns` que existem (DataFrame: devolvido como está)."""
+    if not is_row_selection(df):
+        return df
+    frame = df['frame']
+    positions = [frame.columns.get_loc(col) for col in dict.fromkeys(columns) if col in frame.columns]
+    return frame.iloc[df[SELECTION_ROWS], positions]
+
+# === SKETCHES DE CARDINALIDADE (HyperLogLog) ===
+# Precisão p: 2^p registradores por sketch; erro relativo típico 1.04 / sqrt(2^p)
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_RELATIVE_ERROR = 1.04 / HLL_REGISTERS ** 0.5
+# Colunas com contagem de distintos (o total de pedidos sai exato do cubo)
+DISTINCT_COLUMNS = ['Delivery_person_ID']
+# Dimensões das células dos sketches: poucas, para que cada célula junte muitos pedidos.
+# Filtros nas demais dimensões (tráfego, veículo) usam a contagem exata.
+SKETCH_DIMENSIONS = ['Order_Date', 'City', 'Weatherconditions']
+# Coluna com os registradores de cada célula (HLL_REGISTERS bytes, um int8 por registrador)
+SKETCH_REGISTERS = 'registers'
+# Seleções com até este número de pedidos usam contagem exata (nunique)
+EXACT_DISTINCT_MAX_ROWS = 100_000
+
+# Faixas etárias dos entregadores (intervalos fechados à esquerda)
+AGE_BINS = [18, 25, 35, 45, 55, 65]
+AGE_LABELS = ['18-25', '26-35', '36-45', '46-55', '56-65']
+
+def age_groups(ages):
+    """Faixa etária de cada entregador."""
+    return pd.cut(ages, bins=AGE_BINS, labels=AGE_LABELS, right=False)
+
+def build_distinct_sketch(df, column):
+    """Sketch HyperLogLog denso de `column` por célula (SKETCH_DIMENSIONS).
+
+    Cada linha é uma célula com todos os seus registradores (maior rank observado);
+    células são combinadas tomando o máximo por registrador.
+    """
+    hashes = pd.util.hash_pandas_object(df[column], index=False).to_numpy()
+    register = (hashes >> np.uint64(64 - HLL_PRECISION)).astype('int16')
+    rest = hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+    # rest < 2^52 é exato em float64: frexp devolve o número de bits significativos
+    _, bit_length = np.frexp(rest.astype('float64'))
+    rank = (64 - HLL_PRECISION - bit_length + 1).astype('int8')
+
+    grouper = df.groupby(SKETCH_DIMENSIONS, observed=True, dropna=False, sort=False)
+    cells = grouper.size().index.to_frame(index=False)
+    registers = np.zeros((len(cells), HLL_REGISTERS), dtype='int8')
+    np.maximum.at(registers, (grouper.ngroup().to_numpy(), register), rank)
+    cells[SKETCH_REGISTERS] = [row.tobytes() for row in registers]
+    return cells
+
+def sketch_registers(sketch):
+    """Matriz (células x registradores) de um sketch de distintos."""
+    data = b''.join(sketch[SKETCH_REGISTERS])
+    return np.frombuffer(data, dtype='int8').reshape(-1, HLL_REGISTERS)
+
+def estimate_distinct(sketch):
+    """Estimativa de distintos combinando as células do sketch."""
+    registers = sketch_registers(sketch).max(axis=0, initial=0)
+
+    m = HLL_REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype('float64')))
+    # Correção para cardinalidades pequenas (linear counting)
+    zeros = np.sum(registers == 0)
+    if estimate <= 2.5 * m and zeros > 0:
+        estimate = m * np.log(m / zeros)
+    return int(np.rint(estimate))
+
+def count_distinct(df, column, sketch=None):
+    """Número de valores distintos de `column` e o erro relativo típico (0 se exato)."""
+    if sketch is None or row_count(df) <= EXACT_DISTINCT_MAX_ROWS:
+        return take_columns(df, [column])[column].nunique(), 0.0
+    return estimate_distinct(take_columns(sketch, [SKETCH_REGISTERS])), HLL_RELATIVE_ERROR
+
+# === SKETCHES DE QUANTIS (histogramas mescláveis) ===
+# Contagens de Time_taken(min) por bin de largura fixa em cada célula. Como o
+# tempo é registrado em minutos inteiros, bins de 1 minuto tornam os percentis
+# exatos em posto (rank); para valores fracionários o erro é menor que 1 bin.
+QUANTILE_MEASURE = 'Time_taken(min)'
+QUANTILE_BIN_WIDTH = 1.0
+QUANTILE_DIMENSIONS = ['Order_Date', 'City', 'Road_traffic_density', 'Weatherconditions', 'Type_of_vehicle']
+PERCENTILES = [50, 90, 99]
+
+def is_quantile_sketch(df):
+    """Indica se o DataFrame é um sketch de quantis."""
+    return 'bin' in df.columns and 'count' in df.columns
+
+def build_quantile_sketch(df, measure=QUANTILE_MEASURE):
+    """Histograma de `measure` por célula (data x dimensões), combinável por soma."""
+    values = df[measure].to_numpy(dtype='float64', na_value=np.nan)
+    valid = ~np.isnan(values)
+    bins = np.floor(values[valid] / QUANTILE_BIN_WIDTH).astype('int32')
+    keys = [df.loc[valid, col] for col in QUANTILE_DIMENSIONS]
+    keys.append(pd.Series(bins, index=df.index[valid], name='bin'))
+    sketch = (pd.Series(1, index=df.index[valid], dtype='int64', name='count')
+                .groupby(keys, observed=True, dropna=False, sort=True)
+                .sum()
+                .reset_index())
+    return sketch
+
+def sketch_percentiles(sketch, percentiles=PERCENTILES, by=None):
+    """Percentis combinando os histogramas das células (por grupo, se `by`).
+
+    Usa a definição 'inverted_cdf': o menor valor cuja frequência acumulada
+    alcança q% das observações.
+    """
+    by = list(by or [])
+    hist = sketch.groupby(by + ['bin'], observed=True, sort=True)['count'].sum().reset_index()
+    if not by:
+        hist['_group'] = 0
+        by_cols = ['_group']
+    else:
+        by_cols = by
+
+    rows = []
+    for key, group in hist.groupby(by_cols, observed=True, sort=True):
+        cumulative = group['count'].to_numpy().cumsum()
+        total = cumulative[-1]
+        positions = np.searchsorted(cumulative, np.ceil(np.asarray(percentiles) / 100 * total), side='left')
+        positions = np.minimum(positions, len(cumulative) - 1)
+        values = group['bin'].to_numpy()[positions] * QUANTILE_BIN_WIDTH
+        row = dict(zip(by, key if isinstance(key, tuple) else (key,))) if by else {}
+        row.update({f'p{p}': v for p, v in zip(percentiles, values)})
+        row['count'] = int(total)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=by + [f'p{p}' for p in percentiles] + ['count'])
+
+# === ESTATÍSTICAS POR ENTREGADOR ===
+# Cubo com o entregador como dimensão extra: filtrável como os demais agregados e
+# consolidado em um perfil por entregador e no ranking por cidade.
+DELIVERER_COLUMN = 'Delivery_person_ID'
+DELIVERER_DIMENSIONS = ['Order_Date', 'City', 'Road_traffic_density', 'Weatherconditions',
+                        'Type_of_vehicle', DELIVERER_COLUMN]
+DELIVERER_MEASURES = ['Time_taken(min)', 'Delivery_person_Ratings']
+# Quebras do tempo médio no perfil: coluna -> prefixo
+DELIVERER_BREAKDOWNS = {'Road_traffic_density': 'traffic', 'Weatherconditions': 'weather'}
+
+def build_deliverer_cells(df):
+    """Estatísticas aditivas por entregador e célula de filtro (data x dimensões)."""
+    return build_metrics_cube(df, dimensions=DELIVERER_DIMENSIONS, measures=DELIVERER_MEASURES)
+
+def deliverer_profiles(cells):
+    """Perfil de cada entregador (índice: Delivery_person_ID).
+
+    Colunas: pedidos, média e desvio do tempo, avaliação média e o tempo médio
+    por tráfego e por clima ('time_mean|traffic=Low', ...).
+    """
+    by = [DELIVERER_COLUMN]
+    time = rollup(cells, by, 'Time_taken(min)').set_index(DELIVERER_COLUMN)
+    rating = rollup(cells, by, 'Delivery_person_Ratings').set_index(DELIVERER_COLUMN)
+    profiles = pd.DataFrame({
+        'orders': count_orders(cells, by),
+        'time_mean': time['mean'],
+        'time_std': time['std'],
+        'rating_mean': rating['mean'],
+    })
+    for col, prefix in DELIVERER_BREAKDOWNS.items():
+        breakdown = (rollup(cells, by + [col], 'Time_taken(min)')
+                       .pivot(index=DELIVERER_COLUMN, columns=col, values='mean'))
+        breakdown.columns = [f'time_mean|{prefix}={value}' for value in breakdown.columns]
+        profiles = profiles.join(breakdown)
+    profiles.index.name = DELIVERER_COLUMN
+    return profiles
+
+def top_bottom_by_group(values, groups, n):
+    """Posições dos n menores e dos n maiores valores de cada grupo (seleção parcial).
+
+    `groups` deve estar ordenado (grupos contíguos). Cada grupo passa uma única vez
+    por np.argpartition; só os n selecionados são ordenados.
+    """
+    bounds = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1], True])
+    lowest, highest = [], []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        group = values[start:end]
+        k = min(n, len(group))
+        if k == len(group):
+            low = high = np.arange(len(group))
+        else:
+            low = np.argpartition(group, k - 1)[:k]
+            high = np.argpartition(group, len(group) - k)[len(group) - k:]
+        lowest.append(start + low[np.argsort(group[low], kind='stable')])
+        highest.append(start + high[np.argsort(-group[high], kind='stable')])
+    empty = np.array([], dtype='int64')
+    return (np.concatenate(lowest) if lowest else empty,
+            np.concatenate(highest) if highest else empty)
+
+# === AGREGADOS DERIVADOS ===
+def build_aggregates(df):
+    """Todos os agregados derivados do DataFrame processado (todos particionáveis por data)."""
+    return {
+        'cube': build_metrics_cube(df),
+        'deliverers': build_deliverer_cells(df),
+        'distinct': {col: build_distinct_sketch(df, col) for col in DISTINCT_COLUMNS},
+        'quantiles': build_quantile_sketch(df),
+    }
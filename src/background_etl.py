@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+
+from src.diagnostics import background_run
+
+logger = logging.getLogger(__name__)
+
+class BackgroundETL:
+    """Mantém a última versão boa dos dados e a atualiza numa thread em segundo plano.
+
+    As páginas continuam recebendo a versão atual enquanto o ETL roda; a nova
+    versão só substitui a anterior (troca atômica da referência) depois de
+    carregada por completo. Se a atualização falhar, a versão atual é mantida.
+    """
+
+    def __init__(self, load, load_last_good, source_stamp, on_swap=None):
+        # load(progress) -> dados; load_last_good() -> (dados, stamp ou None) já em disco
+        self._load = load
+        self._load_last_good = load_last_good
+        self._source_stamp = source_stamp
+        self._on_swap = on_swap
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._data = None
+        self._stamp = None # Entradas do ETL da versão atual
+        self._thread = None
+        self._target = None # Entradas sendo processadas pela thread
+        self._failed = None # Entradas cuja última atualização falhou (não tenta de novo)
+        self._progress = (0.0, '')
+        self._error = None
+        self._finished = threading.Event()
+
+    def get(self):
+        """Versão atual dos dados (None antes da primeira carga); dispara a atualização se preciso."""
+        self._ensure_initialized()
+        stamp = self._source_stamp()
+        with self._lock:
+            if stamp != self._stamp and stamp != self._failed and not self._running():
+                self._start(stamp)
+            return self._data
+
+    def _ensure_initialized(self):
+        """Na primeira chamada do processo, serve o que já está em disco (sem esperar o ETL)."""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            try:
+                data, stamp = self._load_last_good()
+            except Exception:
+                logger.exception("Falha ao ler a última versão processada")
+                data, stamp = None, None
+            if data is not None:
+                self._swap(data, stamp)
+            self._initialized = True
+
+    def _running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _start(self, stamp):
+        """Inicia a thread do ETL para as entradas `stamp` (chamado com o lock)."""
+        self._target = stamp
+        self._progress = (0.0, "Iniciando a atualização")
+        self._error = None
+        self._finished.clear()
+        self._thread = threading.Thread(target=self._run, args=(stamp,), name='background-etl', daemon=True)
+        self._thread.start()
+
+    def _report(self, fraction, message):
+        self._progress = (float(fraction), message)
+
+    def _run(self, stamp):
+        # Os tempos das etapas do ETL (@instrumented) vão para um registro próprio ('etl')
+        with background_run('etl', stamp=stamp) as record:
+            self._refresh(stamp, record)
+        self._finished.set()
+
+    def _refresh(self, stamp, record):
+        start = time.perf_counter()
+        try:
+            data = self._load(self._report)
+        except Exception as e:
+            logger.exception("Falha na atualização dos dados em segundo plano")
+            data = None
+            self._error = str(e) or type(e).__name__
+        if data is None:
+            with self._lock:
+                self._failed = stamp
+                self._error = self._error or "Dados brutos indisponíveis"
+            record['status'] = 'falhou'
+            record['error'] = self._error
+        else:
+            self._swap(data, stamp)
+            record['status'] = 'ok'
+            record['version'] = data.get('dataset_version') if isinstance(data, dict) else None
+            logger.info("Dados atualizados em segundo plano (%.1fs)", time.perf_counter() - start)
+
+    def _swap(self, data, stamp):
+        """Publica a nova versão: quem já tem a anterior continua com ela até o próximo rerun."""
+        if self._on_swap is not None:
+            self._on_swap(data)
+        with self._lock:
+            self._data = data
+            self._stamp = stamp
+            self._failed = None
+
+    def wait(self, timeout=None):
+        """Espera a atualização em andamento terminar; retorna True se não há atualização pendente."""
+        thread = self._thread
+        if thread is None:
+            return True
+        return self._finished.wait(timeout)
+
+    def status(self):
+        """Estado da atualização: em andamento, progresso, mensagem e erro da última tentativa."""
+        with self._lock:
+            fraction, message = self._progress
+            return {
+                'running': self._running(),
+                'progress': fraction,
+                'message': message,
+                'error': self._error,
+                'has_data': self._data is not None,
+            }
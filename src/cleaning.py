@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+# Marcadores de valor ausente no texto bruto
+NULL_TOKENS = ['NaN', 'nan', '', 'null', 'NULL']
+
+# Schema de limpeza por coluna. Regras, na ordem em que são aplicadas:
+#   pre:         operações de texto antes da checagem de nulos ('str', 'strip', 'title', ('replace', a, b))
+#   null_tokens: rejeita a linha se o valor for um marcador de nulo
+#   post:        operações de texto depois da checagem de nulos
+#   parse:       'numeric', ('datetime', formato) ou ('extract', regex) -> float
+#   range:       (mín, máx); valores fora do intervalo viram nulos
+#   required:    rejeita a linha se o valor final for nulo
+CLEANING_SCHEMA = {
+    'Delivery_person_Age': {'pre': ['str', 'strip'], 'null_tokens': True, 'parse': 'numeric', 'required': True},
+    'Delivery_person_Ratings': {'parse': 'numeric', 'required': True},
+    'Road_traffic_density': {'pre': ['str', 'strip'], 'null_tokens': True},
+    'City': {'pre': ['str', 'strip'], 'null_tokens': True, 'post': ['title', 'strip']},
+    'Festival': {'pre': ['str', 'strip'], 'null_tokens': True},
+    'multiple_deliveries': {'pre': ['str', 'strip'], 'null_tokens': True, 'parse': 'numeric'},
+    'Order_Date': {'parse': ('datetime', '%d-%m-%Y'), 'required': True},
+    'Time_Orderd': {'parse': ('datetime', '%H:%M:%S')},
+    'Time_Order_picked': {'parse': ('datetime', '%H:%M:%S')},
+    'Weatherconditions': {'post': [('replace', 'conditions ', ''), 'strip']},
+    'Time_taken(min)': {'parse': ('extract', r'(\d+)'), 'required': True},
+    'Restaurant_latitude': {'parse': 'numeric', 'range': (-90, 90)},
+    'Restaurant_longitude': {'parse': 'numeric', 'range': (-180, 180)},
+    'Delivery_location_latitude': {'parse': 'numeric', 'range': (-90, 90)},
+    'Delivery_location_longitude': {'parse': 'numeric', 'range': (-180, 180)},
+}
+
+def _text_ops(values, ops):
+    """Aplica operações de texto em sequência (NaN passa intacto, exceto por 'str')."""
+    for op in ops:
+        if op == 'str':
+            values = values.astype(str)
+        elif op == 'strip':
+            values = values.str.strip()
+        elif op == 'title':
+            values = values.str.title()
+        elif op[0] == 'replace':
+            values = values.str.replace(op[1], op[2], regex=False)
+        else:
+            raise ValueError(f"Operação de texto desconhecida: {op!r}")
+    return values
+
+def _parse(values, parse):
+    """Converte os valores conforme a regra 'parse'."""
+    if parse == 'numeric':
+        return pd.to_numeric(values, errors='coerce')
+    kind, arg = parse
+    if kind == 'datetime':
+        return pd.to_datetime(values, format=arg, errors='coerce')
+    if kind == 'extract':
+        return values.str.extract(arg, expand=False).astype(float)
+    raise ValueError(f"Regra de conversão desconhecida: {parse!r}")
+
+def _clean_values(values, spec):
+    """Aplica as regras de uma coluna a uma Series; retorna (valores, rejeições, anulações) por regra."""
+    rejected = {}
+    nulled = {}
+    values = _text_ops(values, spec.get('pre', []))
+    if spec.get('null_tokens'):
+        rejected['null_token'] = values.isin(NULL_TOKENS).to_numpy()
+    values = _text_ops(values, spec.get('post', []))
+    if 'parse' in spec:
+        values = _parse(values, spec['parse'])
+    if 'range' in spec:
+        low, high = spec['range']
+        out_of_range = ((values < low) | (values > high)).to_numpy()
+        nulled['range'] = out_of_range
+        values = values.mask(out_of_range)
+    if spec.get('required'):
+        rejected['required'] = values.isna().to_numpy()
+    return values, rejected, nulled
+
+def _clean_column(series, spec):
+    """Limpa uma coluna; retorna (valores por posição, rejeições por linha, anulações por linha).
+
+    Colunas de texto são processadas uma vez por valor distinto (factorize) e os
+    resultados voltam às linhas pelos códigos; `valores por posição` é então um
+    par (códigos, valores distintos limpos).
+    """
+    if pd.api.types.is_numeric_dtype(series) and not spec.get('pre') and not spec.get('post'):
+        values, rejected, nulled = _clean_values(series, spec)
+        return values.array, rejected, nulled
+
+    codes, uniques = pd.factorize(series)
+    # Nulos viram um valor distinto extra, para passarem pelas mesmas regras ('str' -> 'nan')
+    codes = np.where(codes < 0, len(uniques), codes)
+    distinct = pd.Series(list(uniques) + [np.nan], dtype=object)
+    values, rejected, nulled = _clean_values(distinct, spec)
+    rejected = {rule: mask[codes] for rule, mask in rejected.items()}
+    nulled = {rule: mask[codes] for rule, mask in nulled.items()}
+    return (codes, values.array), rejected, nulled
+
+def _restore_integer(values):
+    """Volta a inteiro uma coluna numérica sem nulos e só com valores inteiros.
+
+    Os valores distintos incluem o nulo, então a conversão sai em float; nas
+    linhas mantidas o resultado é o mesmo de pd.to_numeric aplicado a elas.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind == 'f' and len(array) and not np.isnan(array).any() and (array == np.floor(array)).all():
+        return array.astype('int64')
+    return values
+
+def clean(df, schema=CLEANING_SCHEMA):
+    """Limpa o DataFrame bruto em uma passada e materializa a saída uma única vez.
+
+    Todas as regras contribuem para uma máscara de validade combinada. Retorna
+    (DataFrame limpo, relatório); o relatório conta, por regra, as linhas
+    rejeitadas ou anuladas (uma linha pode falhar em mais de uma regra).
+    """
+    valid = np.ones(len(df), dtype=bool)
+    cleaned = {}
+    report = {'rows_in': len(df), 'rows_out': 0, 'rejected': {}, 'nulled': {}}
+    for col, spec in schema.items():
+        if col not in df.columns:
+            continue
+        cleaned[col], rejected, nulled = _clean_column(df[col], spec)
+        for rule, mask in rejected.items():
+            report['rejected'][f'{col}:{rule}'] = int(mask.sum())
+            valid &= ~mask
+        for rule, mask in nulled.items():
+            report['nulled'][f'{col}:{rule}'] = int(mask.sum())
+
+    rows = np.flatnonzero(valid)
+    columns = {}
+    for col in df.columns:
+        if col not in cleaned:
+            columns[col] = df[col].array.take(rows)
+        elif isinstance(cleaned[col], tuple):
+            codes, values = cleaned[col]
+            columns[col] = values.take(codes[rows])
+        else:
+            columns[col] = cleaned[col].take(rows)
+        if schema.get(col, {}).get('parse') == 'numeric':
+            columns[col] = _restore_integer(columns[col])
+    report['rows_out'] = len(rows)
+    return pd.DataFrame(columns, index=df.index[rows]), report
+
+def merge_cleaning_reports(reports):
+    """Soma relatórios de limpeza de vários blocos ou partições."""
+    merged = {'rows_in': 0, 'rows_out': 0, 'rejected': {}, 'nulled': {}}
+    for report in reports:
+        merged['rows_in'] += report['rows_in']
+        merged['rows_out'] += report['rows_out']
+        for key in ('rejected', 'nulled'):
+            for rule, count in report[key].items():
+                merged[key][rule] = merged[key].get(rule, 0) + count
+    return merged
@@ -1,13 +1,52 @@
 import pandas as pd
-import streamlit as st
-from datetime import datetime
 import numpy as np
+import hashlib
+import json
+import glob
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote, unquote
+import pyarrow as pa
+import pyarrow.parquet as pq
+import src.aggregates
+import src.cleaning
+from src.aggregates import build_aggregates, DISTINCT_COLUMNS
+from src.diagnostics import instrumented
+from src.cleaning import clean, merge_cleaning_reports
+
+# Linhas por bloco no modo streaming (limita o pico de memória)
+DEFAULT_CHUNKSIZE = 100_000
+
+# Schema compacto do DataFrame processado
+# Dimensões de baixa cardinalidade: armazenadas como category (códigos inteiros)
+CATEGORICAL_COLUMNS = ['City', 'Road_traffic_density', 'Weatherconditions',
+                       'Type_of_vehicle', 'Type_of_order', 'Festival']
+# Colunas numéricas e o tipo de downcast aplicado por pd.to_numeric
+DOWNCAST_COLUMNS = {
+    'Delivery_person_Age': 'integer',
+    'Vehicle_condition': 'integer',
+    'multiple_deliveries': 'integer',
+    'Time_taken(min)': 'integer',
+    'Delivery_person_Ratings': 'float',
+    'Restaurant_latitude': 'float',
+    'Restaurant_longitude': 'float',
+    'Delivery_location_latitude': 'float',
+    'Delivery_location_longitude': 'float',
+    'distance_km': 'float',
+}
+
+logger = logging.getLogger(__name__)
 
 # Extraction
-def extract(filepath):
-    """Extrai dados do arquivo CSV"""
+@instrumented
+def extract(filepath, chunksize=None):
+    """Extrai dados do arquivo CSV (ou um iterador de blocos, se chunksize for informado)"""
     try:
-        df = pd.read_csv(filepath)
+        df = pd.read_csv(filepath, chunksize=chunksize)
         #st.info(f"✅ Dados extraídos com sucesso: {df.shape[0]} linhas, {df.shape[1]} colunas")
         return df
     except FileNotFoundError:
@@ -17,72 +56,683 @@ def extract(filepath):
         #st.error(f"❌ Erro ao extrair dados: {e}")
         return None
 
+# Raio médio da Terra (mesmo valor usado pela biblioteca haversine)
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distância de grande círculo (km) vetorizada; coordenadas NaN resultam em NaN."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(c, dtype='float64')) for c in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def memory_footprint(df):
+    """Memória ocupada pelo DataFrame, em bytes (inclui o conteúdo das strings)"""
+    return int(df.memory_usage(deep=True).sum())
+
+def compact_schema(df):
+    """Aplica o schema compacto: category nas dimensões e o menor tipo numérico seguro"""
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            # Categorias ordenadas: códigos estáveis entre blocos, processos e leituras do cache
+            categories = sorted(df[col].dropna().unique())
+            df[col] = df[col].astype(pd.CategoricalDtype(categories))
+    for col, downcast in DOWNCAST_COLUMNS.items():
+        if col in df.columns:
+            # 'integer' só é aplicado se todos os valores forem inteiros e não nulos
+            df[col] = pd.to_numeric(df[col], downcast=downcast)
+    return df
+
+# Colunas derivadas
+def _seconds_of_day(times):
+    """Segundos desde a meia-noite de cada horário (NaN se inválido)"""
+    return (times - times.dt.normalize()).dt.total_seconds()
+
+def add_time_features(df):
+    """Colunas derivadas dos horários: hora do pedido e espera até a coleta (min).
+
+    A coleta pode ocorrer depois da meia-noite (pedido 23:55, coleta 00:05):
+    a diferença é tomada módulo 24 h.
+    """
+    ordered = _seconds_of_day(df['Time_Orderd'])
+    picked = _seconds_of_day(df['Time_Order_picked'])
+    df['order_hour'] = (ordered // 3600).astype('Int8')
+    df['pickup_wait_min'] = (np.mod(picked - ordered, 24 * 3600) / 60).round().astype('Int16')
+    return df
+
 # Transformation
-def transform(df):
-    """Transforma e limpa os dados"""
-    df1 = df.copy()
-
-    # Limpeza de colunas textuais
-    text_columns = ['Delivery_person_Age', 'Road_traffic_density', 'City', 'Festival', 'multiple_deliveries']
-    for col in text_columns:
-        df1[col] = df1[col].astype(str).str.strip()
-        df1 = df1[~df1[col].isin(['NaN', 'nan', '', 'null', 'NULL'])].copy()
-
-    # Conversões de tipos
-    df1['Delivery_person_Age'] = pd.to_numeric(df1['Delivery_person_Age'], errors='coerce')
-    df1['Delivery_person_Ratings'] = pd.to_numeric(df1['Delivery_person_Ratings'], errors='coerce')
-    df1['multiple_deliveries'] = pd.to_numeric(df1['multiple_deliveries'], errors='coerce')
-    df1['Order_Date'] = pd.to_datetime(df1['Order_Date'], format='%d-%m-%Y', errors='coerce')
-    df1['Time_Orderd'] = pd.to_datetime(df1['Time_Orderd'], format='%H:%M:%S', errors='coerce')
-    df1['Time_Order_picked'] = pd.to_datetime(df1['Time_Order_picked'], format='%H:%M:%S', errors='coerce')
-
-    df1['City'] = df1['City'].str.title().str.strip()
-    df1['Weatherconditions'] = df1['Weatherconditions'].str.replace('conditions ', '', regex=False).str.strip()
-
-    # Tempo de entrega
-    df1['Time_taken(min)'] = df1['Time_taken(min)'].str.extract(r'(\d+)').astype(float)
-
-    # Coordenadas
-    coordinate_columns = ['Restaurant_latitude', 'Restaurant_longitude', 'Delivery_location_latitude', 'Delivery_location_longitude']
-    for col in coordinate_columns:
-        df1[col] = pd.to_numeric(df1[col], errors='coerce')
-    
-    # Validação de coordenadas
-    lat_cols = ['Restaurant_latitude', 'Delivery_location_latitude']
-    lon_cols = ['Restaurant_longitude', 'Delivery_location_longitude']
-    
-    for col in lat_cols:
-        df1.loc[(df1[col] < -90) | (df1[col] > 90), col] = np.nan
-    
-    for col in lon_cols:    
-        df1.loc[(df1[col] < -180) | (df1[col] > 180), col] = np.nan
+@instrumented
+def transform(df, compact=True, report=False):
+    """Transforma e limpa os dados (com report=True, retorna também o relatório de limpeza)"""
+    # Limpeza pelo schema declarativo (src/cleaning.py): uma máscara e uma materialização
+    df1, cleaning_report = clean(df)
+    df1 = add_time_features(df1)
 
-    df1.dropna(subset=['Delivery_person_Age', 'Delivery_person_Ratings', 'Order_Date', 'Time_taken(min)'], inplace=True)
+    # Distância restaurante -> entrega (calculada uma única vez)
+    df1['distance_km'] = haversine_km(df1['Restaurant_latitude'], df1['Restaurant_longitude'],
+                                      df1['Delivery_location_latitude'], df1['Delivery_location_longitude'])
+
+    if compact:
+        df1 = compact_schema(df1)
     
-    return df1
+    return (df1, cleaning_report) if report else df1
+
+# Transformação paralela
+def split_partitions(df, n_partitions):
+    """Divide o DataFrame em até n_partitions blocos contíguos de linhas."""
+    bounds = np.linspace(0, len(df), max(1, n_partitions) + 1, dtype='int64')
+    return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+@instrumented
+def transform_parallel(df, workers=None, n_partitions=None, compact=True, report=False):
+    """Executa o transform em partições de linhas num ProcessPoolExecutor.
+
+    As partições são concatenadas na ordem original, então o resultado é o
+    mesmo do transform serial (os relatórios de limpeza são somados).
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = split_partitions(df, n_partitions or workers)
+    if workers == 1 or len(partitions) <= 1:
+        results = [transform(part, compact=False, report=True) for part in partitions]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map preserva a ordem das partições
+            results = list(executor.map(partial(transform, compact=False, report=True), partitions))
+    if not results:
+        results = [transform(df, compact=False, report=True)]
+    df_clean = pd.concat([part for part, _ in results])
+    if compact:
+        df_clean = compact_schema(df_clean)
+    if report:
+        return df_clean, merge_cleaning_reports([part_report for _, part_report in results])
+    return df_clean
 
 # Loading
-def load(df, output_path):
-    """Salva o DataFrame processado"""
+# Saída particionada: <saída>/<versão>/Order_Date=AAAA-MM-DD/City=<cidade>/<parte>.parquet (zstd).
+# Cada execução grava uma versão nova em <versão>.tmp, renomeia o diretório e só então
+# troca o ponteiro CURRENT_FILE (os.replace): leitores veem a versão inteira ou a anterior.
+# As colunas de partição continuam dentro dos arquivos (os tipos não dependem do caminho).
+PARTITION_COLUMNS = ['Order_Date', 'City']
+PARQUET_COMPRESSION = 'zstd'
+CURRENT_FILE = '_CURRENT'
+VERSION_PREFIX = 'v-'
+# Versões anteriores mantidas: quem ainda lê a versão anterior (ex.: backend SQL) continua válido
+KEEP_PREVIOUS_VERSIONS = 1
+# Diretórios <versão>.tmp sem escrita há mais que isto (s) são sobras de execuções interrompidas;
+# os mais recentes podem ser de outra execução em andamento e não são removidos
+ABANDONED_TMP_SECONDS = 3600
+# Valor de partição dos nulos (mesma convenção do Hive)
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+def partition_key(column, value):
+    """Segmento de caminho de uma partição ('Order_Date=2022-03-01', 'City=Urban')"""
+    if pd.isna(value):
+        return f"{column}={NULL_PARTITION}"
+    if column == 'Order_Date':
+        return _date_partition(value)
+    return f"{column}={quote(str(value), safe='')}"
+
+def partition_values(path):
+    """Chaves de partição do caminho de um arquivo ({coluna: valor em texto ou None})"""
+    values = {}
+    for part in os.path.normpath(path).split(os.sep)[:-1]:
+        column, sep, value = part.partition('=')
+        if sep:
+            values[column] = None if value == NULL_PARTITION else unquote(value)
+    return values
+
+def prune_partition_files(paths, date_range=None, cities=None):
+    """Arquivos cujas partições podem ter pedidos do período e das cidades, sem abrir nenhum arquivo.
+
+    Um arquivo sem a chave de uma partição (ex.: armazenamento incremental, sem
+    cidade) não é descartado por ela. Datas nulas não são descartadas; cidades nulas
+    nunca passam pelo filtro de cidades.
+    """
+    if date_range is not None:
+        start, end = (f"{pd.Timestamp(d):%Y-%m-%d}" for d in date_range)
+    cities = None if cities is None else {str(c) for c in cities}
+    selected = []
+    for path in paths:
+        values = partition_values(path)
+        date = values.get('Order_Date')
+        if date_range is not None and date is not None and not start <= date <= end:
+            continue
+        if cities is not None and 'City' in values and values['City'] not in cities:
+            continue
+        selected.append(path)
+    return selected
+
+def _write_partition(table, rows, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table if rows is None else table.take(rows), path, compression=PARQUET_COMPRESSION)
+
+def write_partitions(df, version_dir, name='part-00000', workers=None):
+    """Grava o DataFrame nas partições por data e cidade, um arquivo por partição, em paralelo.
+
+    O DataFrame é convertido para Arrow uma única vez; as threads separam as
+    linhas de cada partição e comprimem os arquivos (o pyarrow libera o GIL).
+    Um DataFrame vazio vira um único arquivo com as colunas. Retorna o número de arquivos.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    groups = df.groupby([df[col] for col in PARTITION_COLUMNS], observed=True, dropna=False).indices
+    jobs = [(rows, os.path.join(version_dir, *(partition_key(col, value) for col, value in zip(PARTITION_COLUMNS, key)),
+                                f"{name}.parquet"))
+            for key, rows in groups.items()]
+    if not jobs:
+        jobs = [(None, os.path.join(version_dir, f"{name}.parquet"))]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda job: _write_partition(table, *job), jobs))
+    return len(jobs)
+
+def _compact_partition(paths, name='part-00000'):
+    """Junta os arquivos de uma partição (um por bloco) num único arquivo."""
+    directory = os.path.dirname(paths[0])
+    tmp_path = os.path.join(directory, f"{name}.parquet.tmp")
+    # A leitura reconcilia os schemas dos blocos (downcast e categorias de cada um)
+    table = pa.Table.from_pandas(_read_parquet_files(paths), preserve_index=False)
+    pq.write_table(table, tmp_path, compression=PARQUET_COMPRESSION)
+    for path in paths:
+        os.remove(path)
+    os.replace(tmp_path, os.path.join(directory, f"{name}.parquet"))
+
+def compact_partitions(version_dir, workers=None):
+    """Deixa um único arquivo em cada partição com vários, em paralelo. Retorna o número de arquivos."""
+    partitions = {}
+    for path in sorted(glob.glob(os.path.join(version_dir, '**', '*.parquet'), recursive=True)):
+        partitions.setdefault(os.path.dirname(path), []).append(path)
+    jobs = [paths for paths in partitions.values() if len(paths) > 1]
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(jobs))) as executor:
+            list(executor.map(_compact_partition, jobs))
+    return len(partitions)
+
+def read_current_version(output_path):
+    """Versão publicada da saída processada (None se ainda não houver)"""
     try:
-        df.to_csv(output_path, index=False)
+        with open(os.path.join(output_path, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+def processed_files(output_path):
+    """Arquivos Parquet da versão publicada, ordenados por partição (lista vazia se não houver)"""
+    version = read_current_version(output_path)
+    if version is None:
+        return []
+    return sorted(glob.glob(os.path.join(output_path, version, '**', '*.parquet'), recursive=True))
+
+def _begin_version(output_path):
+    """Nome e diretório temporário de uma nova versão da saída"""
+    if os.path.isfile(output_path):
+        os.remove(output_path) # Saída antiga em arquivo único
+    version = f"{VERSION_PREFIX}{time.time_ns()}"
+    return version, os.path.join(output_path, f"{version}.tmp")
+
+def _last_modified(directory):
+    """Última modificação (mtime) do diretório ou de qualquer item dentro dele."""
+    latest = os.stat(directory).st_mtime
+    for root, dirs, files in os.walk(directory):
+        for entry in dirs + files:
+            try:
+                latest = max(latest, os.stat(os.path.join(root, entry)).st_mtime)
+            except FileNotFoundError:
+                pass # Removido durante a varredura
+    return latest
+
+def _publish_version(output_path, version, tmp_dir):
+    """Torna a versão visível (rename do diretório + troca do ponteiro) e remove as antigas"""
+    os.replace(tmp_dir, os.path.join(output_path, version))
+    path = os.path.join(output_path, CURRENT_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    # Versões mais antigas que a publicada e sobras .tmp abandonadas
+    older = sorted(d for d in os.listdir(output_path) if d.startswith(VERSION_PREFIX) and d < version)
+    complete = [d for d in older if not d.endswith('.tmp')]
+    keep = set(complete[len(complete) - KEEP_PREVIOUS_VERSIONS:]) if KEEP_PREVIOUS_VERSIONS else set()
+    now = time.time()
+    for name in older:
+        if name in keep:
+            continue
+        if name.endswith('.tmp') and now - _last_modified(os.path.join(output_path, name)) < ABANDONED_TMP_SECONDS:
+            continue
+        shutil.rmtree(os.path.join(output_path, name), ignore_errors=True)
+
+@instrumented
+def load(df, output_path, workers=None):
+    """Salva o DataFrame processado em Parquet particionado (zstd), publicado de forma atômica"""
+    try:
+        version, tmp_dir = _begin_version(output_path)
+        write_partitions(df, tmp_dir, workers=workers)
+        _publish_version(output_path, version, tmp_dir)
         #print(f"Dataset limpo salvo em: {output_path}")
         return True
     except Exception as e:
         #print(f"Erro ao salvar arquivo: {e}")
         return False
 
+# Cache em disco
+# Módulos que definem os dados processados: limpeza, transformação e os agregados
+# gravados por data no armazenamento incremental
+VERSIONED_MODULES = [src.cleaning.__file__, __file__, src.aggregates.__file__]
+
+def transform_version():
+    """Hash do código dos módulos versionados: qualquer mudança nas regras invalida o cache"""
+    digest = hashlib.sha256()
+    for path in VERSIONED_MODULES:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def file_fingerprint(filepath, chunk_size=1 << 20):
+    """Tamanho, mtime e hash do conteúdo do arquivo bruto"""
+    stat = os.stat(filepath)
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': digest.hexdigest(),
+    }
+
+def output_stat(output_path):
+    """Versão publicada da saída processada, gravada no fingerprint que a acompanha"""
+    return {'version': read_current_version(output_path)}
+
+def fingerprint_path(output_path):
+    """Caminho do arquivo de fingerprint que acompanha a saída processada"""
+    return f"{output_path}.fingerprint.json"
+
+def read_fingerprint(output_path):
+    """Lê o fingerprint salvo junto da saída processada (None se ausente)"""
+    try:
+        with open(fingerprint_path(output_path), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_fingerprint(output_path, fingerprint):
+    """Grava o fingerprint de forma atômica"""
+    path = fingerprint_path(output_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(fingerprint, f, indent=2)
+    os.replace(tmp_path, path)
+
+def read_last_good(output_path):
+    """Fingerprint da última saída completa, ou None se a saída e o fingerprint não correspondem.
+
+    A versão do Parquet é publicada antes do fingerprint; entre as duas trocas (ou
+    com uma versão de outra execução) o par é inconsistente e não deve ser lido.
+    """
+    stored = read_fingerprint(output_path)
+    if stored is None or read_current_version(output_path) is None:
+        return None
+    return stored if stored.get('output') == output_stat(output_path) else None
+
+def dataset_version(metadata):
+    """Versão curta dos dados processados: hash do fingerprint ou do manifesto"""
+    payload = json.dumps(metadata, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+def is_cache_valid(input_path, output_path):
+    """Verifica se a saída processada corresponde ao arquivo bruto e à versão do transform"""
+    stored = read_last_good(output_path)
+    if stored is None:
+        return False
+    if stored.get('transform_version') != transform_version():
+        return False
+    raw = stored.get('raw', {})
+    stat = os.stat(input_path)
+    # Tamanho e mtime iguais: evita reler o arquivo bruto inteiro
+    if raw.get('size') == stat.st_size and raw.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    # mtime mudou (ex.: novo deploy), mas o conteúdo pode ser o mesmo
+    return raw.get('sha256') == file_fingerprint(input_path)['sha256']
+
+@instrumented
+def read_processed(output_path, date_range=None, cities=None):
+    """Lê a saída processada; com date_range e/ou cities, abre só as partições selecionadas
+
+    Retorna None se nenhuma partição for selecionada.
+    """
+    # _read_parquet_files reaplica o schema: normaliza as categorias vindas de partições diferentes
+    return _read_parquet_files(prune_partition_files(processed_files(output_path), date_range, cities))
+
+def log_cleaning_report(report):
+    """Registra as linhas rejeitadas pela limpeza e retorna o relatório"""
+    logger.info("Limpeza: %d -> %d linhas; rejeições por regra: %s",
+                report['rows_in'], report['rows_out'],
+                {rule: count for rule, count in report['rejected'].items() if count})
+    return report
+
+def log_memory_footprint(before, after):
+    """Registra a memória antes/depois do schema compacto e retorna o relatório"""
+    report = {'before_bytes': before, 'after_bytes': after,
+              'reduction': round(1 - after / before, 4) if before else 0.0}
+    logger.info("Schema compacto: %.1f MB -> %.1f MB (%.0f%% menor)",
+                before / 2**20, after / 2**20, report['reduction'] * 100)
+    return report
+
+# Pipeline ETL em blocos
+@instrumented
+def stream_etl(input_path, output_path, chunksize=DEFAULT_CHUNKSIZE):
+    """Executa o ETL bloco a bloco, gravando as partições de cada bloco numa nova versão.
+
+    Antes da publicação, os arquivos de cada bloco são compactados num único
+    arquivo por partição (mesmo layout do ETL em memória).
+
+    Retorna o total de linhas, o relatório de memória do schema compacto e o
+    relatório de limpeza somado de todos os blocos.
+    """
+    chunks = extract(input_path, chunksize=chunksize)
+    if chunks is None:
+        return None
+
+    version, tmp_dir = _begin_version(output_path)
+    df_clean = None
+    n_rows = 0
+    footprint_before = footprint_after = 0
+    reports = []
+    for i, df_chunk in enumerate(chunks):
+        df_clean, chunk_report = transform(df_chunk, compact=False, report=True)
+        reports.append(chunk_report)
+        footprint_before += memory_footprint(df_clean)
+        df_clean = compact_schema(df_clean)
+        footprint_after += memory_footprint(df_clean)
+        if df_clean.empty:
+            continue
+        # Um arquivo por bloco em cada partição, compactados ao final
+        write_partitions(df_clean, tmp_dir, name=f"part-{i:05d}")
+        n_rows += len(df_clean)
+
+    if df_clean is None:
+        return None
+    if n_rows == 0:
+        # Nenhuma linha válida: grava o último bloco (vazio) com as colunas do transform
+        write_partitions(df_clean, tmp_dir)
+    compact_partitions(tmp_dir)
+    _publish_version(output_path, version, tmp_dir)
+    return (n_rows, log_memory_footprint(footprint_before, footprint_after),
+            log_cleaning_report(merge_cleaning_reports(reports)))
+
 # Pipeline ETL
-@st.cache_data
-def run_etl(input_path, output_path):
-    """Executa o pipeline ETL completo"""
+def _report_progress(progress, fraction, message):
+    """Repassa o andamento do ETL (fração de 0 a 1, mensagem) ao callback, se houver"""
+    if progress is not None:
+        progress(fraction, message)
+
+def run_etl(input_path, output_path, chunksize=None, workers=None, progress=None):
+    """Executa o pipeline ETL completo, reutilizando o cache em disco quando válido.
+
+    Com chunksize, o arquivo bruto é processado em blocos e a memória de pico
+    do ETL fica limitada ao tamanho do bloco; o retorno ainda é o DataFrame
+    processado inteiro, lido de volta do Parquet. Com workers > 1, o transform
+    roda em paralelo em partições de linhas (transform_parallel). `progress`
+    recebe (fração, mensagem) no início de cada etapa.
+    """
+    if not os.path.exists(input_path):
+        return None
+
+    if is_cache_valid(input_path, output_path):
+        _report_progress(progress, 0.5, "Lendo os dados processados")
+        return read_processed(output_path)
+
+    fingerprint = {'raw': file_fingerprint(input_path), 'transform_version': transform_version()}
+
+    if chunksize:
+        _report_progress(progress, 0.1, "Processando o arquivo bruto em blocos")
+        result = stream_etl(input_path, output_path, chunksize=chunksize)
+        if result is None:
+            return None
+        fingerprint['memory_footprint'] = result[1]
+        fingerprint['cleaning'] = result[2]
+        fingerprint['output'] = output_stat(output_path)
+        write_fingerprint(output_path, fingerprint)
+        return read_processed(output_path)
+
     # Extract
+    _report_progress(progress, 0.05, "Lendo o arquivo bruto")
     df_raw = extract(input_path)
 
     # Transform
-    df_clean = transform(df_raw)
+    _report_progress(progress, 0.25, "Limpando e transformando")
+    if workers and workers > 1:
+        df_clean, cleaning_report = transform_parallel(df_raw, workers=workers, compact=False, report=True)
+    else:
+        df_clean, cleaning_report = transform(df_raw, compact=False, report=True)
+    # Mesma ordem da leitura das partições: a execução e o cache retornam as linhas iguais
+    df_clean = df_clean.sort_values(PARTITION_COLUMNS, kind='stable', na_position='last').reset_index(drop=True)
+    fingerprint['cleaning'] = log_cleaning_report(cleaning_report)
+    footprint_before = memory_footprint(df_clean)
+    df_clean = compact_schema(df_clean)
+    fingerprint['memory_footprint'] = log_memory_footprint(footprint_before, memory_footprint(df_clean))
 
     # Load
-    load(df_clean, output_path)
+    _report_progress(progress, 0.55, "Gravando os dados processados")
+    if load(df_clean, output_path):
+        fingerprint['output'] = output_stat(output_path)
+        write_fingerprint(output_path, fingerprint)
+
+    return df_clean 
+
+# === ETL INCREMENTAL ===
+# Armazenamento: <store>/<versão>/data/Order_Date=AAAA-MM-DD/<lote>.parquet, agregados por data em
+# <store>/<versão>/aggregates/<nome>/Order_Date=AAAA-MM-DD.parquet e o manifesto dos lotes já
+# processados. Cada atualização monta uma versão nova (hard links dos arquivos da atual, só os
+# afetados são regravados) e a publica como o ETL em memória (_publish_version): leitores veem
+# a versão inteira ou a anterior, nunca dados novos com agregados antigos.
+MANIFEST_FILE = 'manifest.json'
+
+def _date_partition(date):
+    """Nome do diretório de partição de uma data."""
+    return f"Order_Date={pd.Timestamp(date):%Y-%m-%d}"
+
+def _write_parquet_atomic(df, path):
+    """Grava um Parquet via arquivo temporário + rename."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def _read_parquet_file(path):
+    return pq.ParquetFile(path, memory_map=True).read()
+
+def _read_parquet_files(paths):
+    """Concatena arquivos Parquet (schemas podem diferir no downcast) e reaplica o schema compacto.
+
+    Os arquivos são lidos em paralelo (threads) e concatenados no pyarrow: com
+    muitas partições pequenas, o custo por arquivo domina a leitura.
+    """
+    paths = sorted(paths)
+    if not paths:
+        return None
+    with ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, len(paths))) as executor:
+        tables = list(executor.map(_read_parquet_file, paths))
+    # Só arquivos vizinhos com o mesmo schema são concatenados no pyarrow: os metadados
+    # do pandas (ex.: Int8 x Int16 de blocos diferentes) valem para o grupo inteiro
+    frames, run = [], tables[:1]
+    for table in tables[1:]:
+        if not table.schema.equals(run[0].schema, check_metadata=True):
+            frames.append(pa.concat_tables(run).to_pandas())
+            run = []
+        run.append(table)
+    frames.append(pa.concat_tables(run).to_pandas())
+    return compact_schema(pd.concat(frames, ignore_index=True))
+
+def _store_version_dir(store_dir, version=None):
+    """Diretório da versão `version` (ou da publicada) do armazenamento; None se não houver."""
+    version = version or read_current_version(store_dir)
+    return None if version is None else os.path.join(store_dir, version)
+
+def read_manifest(store_dir, version=None):
+    """Manifesto do armazenamento incremental (lotes processados e versão do transform)."""
+    version_dir = _store_version_dir(store_dir, version)
+    try:
+        with open(os.path.join(version_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (TypeError, FileNotFoundError, json.JSONDecodeError):
+        return {'transform_version': None, 'batches': {}}
+
+def _write_manifest(store_dir, manifest):
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _is_batch_processed(entry, filepath):
+    """Lote já processado: mesmo tamanho e mtime, ou mesmo conteúdo (hash)."""
+    if entry is None:
+        return False
+    stat = os.stat(filepath)
+    if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    return entry['sha256'] == file_fingerprint(filepath)['sha256']
+
+def _link_tree(source, target):
+    """Replica a árvore de uma versão publicada com hard links (sem copiar os dados).
+
+    Os arquivos ligados nunca são alterados no lugar: quem atualiza grava um
+    arquivo novo e o troca via os.replace (_write_parquet_atomic, _write_manifest).
+    """
+    for root, _, files in os.walk(source):
+        directory = os.path.join(target, os.path.relpath(root, source))
+        os.makedirs(directory, exist_ok=True)
+        for name in files:
+            try:
+                os.link(os.path.join(root, name), os.path.join(directory, name))
+            except OSError:
+                shutil.copy2(os.path.join(root, name), os.path.join(directory, name)) # Sem hard links
+
+def _remove_batch_partitions(store_dir, name, dates):
+    """Remove as partições por data gravadas por um lote."""
+    for date in dates:
+        path = os.path.join(store_dir, 'data', _date_partition(date), f"{name}.parquet")
+        if os.path.exists(path):
+            os.remove(path)
+
+def _update_aggregates(store_dir, dates):
+    """Recalcula os agregados derivados apenas das datas afetadas."""
+    for date in dates:
+        partition = _date_partition(date)
+        df_day = _read_parquet_files(glob.glob(os.path.join(store_dir, 'data', partition, '*.parquet')))
+        targets = {}
+        if df_day is not None:
+            aggregates = build_aggregates(df_day)
+            targets['cube'] = aggregates['cube']
+            targets['deliverers'] = aggregates['deliverers']
+            targets['quantiles'] = aggregates['quantiles']
+            for col, sketch in aggregates['distinct'].items():
+                targets[f'distinct_{col}'] = sketch
+        for name in ['cube', 'deliverers', 'quantiles'] + [f'distinct_{col}' for col in DISTINCT_COLUMNS]:
+            path = os.path.join(store_dir, 'aggregates', name, f"{partition}.parquet")
+            if name in targets:
+                _write_parquet_atomic(targets[name], path)
+            elif os.path.exists(path):
+                os.remove(path) # A data ficou sem pedidos
+
+@instrumented
+def run_incremental_etl(raw_dir, store_dir, pattern='*.csv', progress=None):
+    """Processa apenas os lotes novos (ou alterados) de raw_dir.
+
+    Cada lote é transformado e gravado nas partições por data do armazenamento;
+    lotes que saíram de raw_dir têm suas partições removidas. Os agregados
+    derivados são atualizados só para as datas afetadas, e o resultado é
+    publicado como uma nova versão. Retorna a lista de datas afetadas.
+    """
+    current = read_current_version(store_dir)
+    manifest = read_manifest(store_dir, current)
+    version = transform_version()
+    # Regras de limpeza mudaram (ou não há versão): reprocessa todo o histórico
+    rebuild = current is None or manifest['transform_version'] != version
+    if rebuild:
+        manifest = {'transform_version': version, 'batches': {}}
+
+    filepaths = sorted(glob.glob(os.path.join(raw_dir, pattern)))
+    names = {os.path.basename(filepath) for filepath in filepaths}
+    removed = sorted(set(manifest['batches']) - names)
+    pending = [filepath for filepath in filepaths
+               if not _is_batch_processed(manifest['batches'].get(os.path.basename(filepath)), filepath)]
+    if not (rebuild or removed or pending):
+        return []
+
+    new_version, tmp_dir = _begin_version(store_dir)
+    os.makedirs(tmp_dir)
+    if not rebuild:
+        _link_tree(os.path.join(store_dir, current), tmp_dir)
+
+    affected = set()
+    # Lotes removidos de raw_dir: saem do manifesto, das partições e dos agregados
+    for name in removed:
+        entry = manifest['batches'].pop(name)
+        _remove_batch_partitions(tmp_dir, name, entry['dates'])
+        affected.update(entry['dates'])
+
+    for i, filepath in enumerate(pending):
+        name = os.path.basename(filepath)
+        entry = manifest['batches'].get(name)
+        _report_progress(progress, 0.6 * i / len(pending), f"Processando o lote {name}")
+
+        # Lote alterado: remove as partições gravadas pela versão anterior
+        if entry is not None:
+            _remove_batch_partitions(tmp_dir, name, entry['dates'])
+            affected.update(entry['dates'])
+
+        df_raw = extract(filepath)
+        if df_raw is None:
+            continue
+        df_clean, cleaning_report = transform(df_raw, report=True)
+        dates = []
+        for date, df_day in df_clean.groupby(df_clean['Order_Date'].dt.normalize(), sort=True):
+            _write_parquet_atomic(df_day, os.path.join(tmp_dir, 'data', _date_partition(date), f"{name}.parquet"))
+            dates.append(f"{date:%Y-%m-%d}")
+        affected.update(dates)
+        manifest['batches'][name] = {**file_fingerprint(filepath), 'dates': dates,
+                                   'cleaning': log_cleaning_report(cleaning_report)}
+
+    _report_progress(progress, 0.6, "Atualizando os agregados")
+    _update_aggregates(tmp_dir, sorted(affected))
+    _write_manifest(tmp_dir, manifest)
+    _publish_version(store_dir, new_version, tmp_dir)
+    if current is None:
+        # Layout antigo, sem versões: partições, agregados e manifesto direto no armazenamento
+        shutil.rmtree(os.path.join(store_dir, 'data'), ignore_errors=True)
+        shutil.rmtree(os.path.join(store_dir, 'aggregates'), ignore_errors=True)
+        if os.path.exists(os.path.join(store_dir, MANIFEST_FILE)):
+            os.remove(os.path.join(store_dir, MANIFEST_FILE))
+    return sorted(affected)
+
+def store_files(store_dir, version=None):
+    """Arquivos Parquet dos pedidos da versão `version` (ou da publicada) do armazenamento."""
+    version_dir = _store_version_dir(store_dir, version)
+    if version_dir is None:
+        return []
+    return sorted(glob.glob(os.path.join(version_dir, 'data', '*', '*.parquet')))
+
+@instrumented
+def read_store(store_dir, version=None):
+    """Lê todo o histórico processado do armazenamento incremental."""
+    df = _read_parquet_files(store_files(store_dir, version))
+    if df is None:
+        return None
+    return df.sort_values('Order_Date', kind='stable').reset_index(drop=True)
+
+@instrumented
+def read_store_aggregates(store_dir, version=None):
+    """Lê os agregados derivados (mesmo formato de build_aggregates) do armazenamento incremental."""
+    version_dir = _store_version_dir(store_dir, version)
 
-    return df_clean 
\ No newline at end of file
+    def read(name):
+        if version_dir is None:
+            return None
+        return _read_parquet_files(glob.glob(os.path.join(version_dir, 'aggregates', name, '*.parquet')))
+    return {
+        'cube': read('cube'),
+        'deliverers': read('deliverers'),
+        'distinct': {col: read(f'distinct_{col}') for col in DISTINCT_COLUMNS},
+        'quantiles': read('quantiles'),
+    }
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from src.result_cache import estimate_size, get_result_cache
+
+# Instrumentação ligada pela variável de ambiente CURRY_DIAGNOSTICS:
+#   1 / true -> tempos por chamada; memory -> também memória alocada (tracemalloc)
+DIAGNOSTICS_MODE = os.environ.get('CURRY_DIAGNOSTICS', '').strip().lower()
+DIAGNOSTICS_ENABLED = DIAGNOSTICS_MODE not in ('', '0', 'false', 'no', 'off')
+TRACE_MEMORY = DIAGNOSTICS_MODE == 'memory'
+# Registros por rerun (JSON lines)
+DIAGNOSTICS_LOG_PATH = os.environ.get('CURRY_DIAGNOSTICS_LOG', 'logs/diagnostics.jsonl')
+# Reruns considerados nos percentis móveis e chamadas listadas no painel
+HISTORY_SIZE = 200
+SLOWEST_CALLS = 10
+
+# Coletor do rerun em andamento (o Streamlit executa cada sessão em sua thread)
+_state = threading.local()
+_log_lock = threading.Lock()
+# Objetos compartilhados por todas as sessões do processo (nome -> bytes)
+_shared_memory = {}
+# Último registro de cada trabalho em segundo plano do processo (nome -> registro)
+_background_records = {}
+
+def _collector():
+    return getattr(_state, 'rerun', None)
+
+@contextmanager
+def timed(name):
+    """Mede um trecho do rerun atual; sem rerun ativo (ou desligado) não faz nada."""
+    rerun = _collector()
+    if rerun is None:
+        yield
+        return
+    call = {'name': name, 'depth': rerun['depth']}
+    rerun['depth'] += 1
+    memory_before = tracemalloc.get_traced_memory()[0] if TRACE_MEMORY else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        call['seconds'] = time.perf_counter() - start
+        if memory_before is not None:
+            call['memory_delta_bytes'] = tracemalloc.get_traced_memory()[0] - memory_before
+        rerun['depth'] -= 1
+        rerun['calls'].append(call)
+
+def instrumented(func):
+    """Decorador: mede cada chamada de `func` no rerun atual."""
+    if not DIAGNOSTICS_ENABLED:
+        return func
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with timed(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+def register_shared_memory(name, n_bytes):
+    """Registra a memória de um objeto carregado uma vez e compartilhado pelas sessões do processo."""
+    _shared_memory[name] = n_bytes
+
+def session_memory_bytes():
+    """Memória aproximada (bytes) guardada no st.session_state da sessão atual."""
+    return sum(estimate_size(value) for value in st.session_state.to_dict().values())
+
+def start_rerun(page):
+    """Inicia a coleta de um rerun da página (chamar no topo do script)."""
+    if not DIAGNOSTICS_ENABLED:
+        return
+    if TRACE_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    _state.rerun = {'page': page, 'start': time.perf_counter(), 'depth': 0, 'calls': []}
+
+@contextmanager
+def background_run(page, **fields):
+    """Coleta as chamadas de um trabalho fora dos reruns (ex.: o ETL em segundo plano).
+
+    Roda na thread do trabalho; ao final grava o registro (com `fields` e o que o
+    bloco acrescentar ao dicionário recebido) e o guarda para o painel.
+    """
+    if not DIAGNOSTICS_ENABLED:
+        yield fields
+        return
+    _state.rerun = {'page': page, 'start': time.perf_counter(), 'depth': 0, 'calls': []}
+    try:
+        yield fields
+    finally:
+        rerun = _collector()
+        _state.rerun = None
+        record = {
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'page': page,
+            'session': None,
+            'total_seconds': time.perf_counter() - rerun['start'],
+            'calls': rerun['calls'],
+            **fields,
+        }
+        _write_record(record)
+        _background_records[page] = record
+
+def finish_rerun():
+    """Encerra a coleta, grava o registro em JSON lines e desenha o painel na barra lateral."""
+    rerun = _collector()
+    if rerun is None:
+        return None
+    _state.rerun = None
+
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+        'page': rerun['page'],
+        'session': _session_id(),
+        'total_seconds': time.perf_counter() - rerun['start'],
+        'calls': rerun['calls'],
+    }
+    if TRACE_MEMORY:
+        record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+    # Memória própria da sessão x dados compartilhados pelo processo
+    record['session_bytes'] = session_memory_bytes()
+    record['shared_bytes'] = sum(_shared_memory.values())
+    # Contadores acumulados do cache de resultados do processo (acertos entre reruns e sessões)
+    record['result_cache'] = get_result_cache().stats()
+    _write_record(record)
+    _update_history(record)
+    render_diagnostics(record)
+    return record
+
+def _session_id():
+    """Identificador da sessão do Streamlit (None fora do servidor)."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx is not None else None
+    except Exception:
+        return None
+
+def _write_record(record):
+    """Acrescenta o registro ao arquivo JSON lines."""
+    os.makedirs(os.path.dirname(DIAGNOSTICS_LOG_PATH) or '.', exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _log_lock:
+        with open(DIAGNOSTICS_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+def _update_history(record):
+    """Guarda os tempos do rerun no histórico da sessão (janela de HISTORY_SIZE reruns)."""
+    history = st.session_state.setdefault('_diagnostics_history', {})
+    totals = {}
+    for call in record['calls']:
+        totals[call['name']] = totals.get(call['name'], 0.0) + call['seconds']
+    totals[f"rerun:{record['page']}"] = record['total_seconds']
+    for name, seconds in totals.items():
+        history.setdefault(name, deque(maxlen=HISTORY_SIZE)).append(seconds)
+
+def rolling_percentiles(history):
+    """p50/p95 (ms) de cada chamada ao longo dos reruns da sessão."""
+    rows = []
+    for name, values in history.items():
+        p50, p95 = np.percentile(np.fromiter(values, dtype='float64'), [50, 95]) * 1000
+        rows.append({'Chamada': name, 'Reruns': len(values), 'p50 (ms)': round(p50, 1), 'p95 (ms)': round(p95, 1)})
+    return pd.DataFrame(rows, columns=['Chamada', 'Reruns', 'p50 (ms)', 'p95 (ms)']).sort_values('p95 (ms)', ascending=False)
+
+def _calls_table(calls):
+    """Tabela das chamadas mais lentas de um registro."""
+    slowest = sorted(calls, key=lambda c: c['seconds'], reverse=True)[:SLOWEST_CALLS]
+    return pd.DataFrame({
+        'Chamada': ['  ' * c['depth'] + c['name'] for c in slowest],
+        'Tempo (ms)': [round(c['seconds'] * 1000, 1) for c in slowest],
+    })
+
+def render_diagnostics(record):
+    """Seção 'Diagnóstico' da barra lateral: chamadas mais lentas, percentis móveis e último ETL."""
+    with st.sidebar.expander("Diagnóstico"):
+        st.write(f"Rerun: {record['total_seconds'] * 1000:.0f} ms")
+        if 'peak_bytes' in record:
+            st.write(f"Pico de memória alocada: {record['peak_bytes'] / 2**20:.1f} MB")
+        st.write(f"Memória da sessão: {record['session_bytes'] / 2**20:.2f} MB "
+                 f"(dados compartilhados pelo processo: {record['shared_bytes'] / 2**20:.1f} MB)")
+        cache = record['result_cache']
+        st.write(f"Cache de resultados: {cache['hits']} acertos, {cache['misses']} erros "
+                 f"(taxa {cache['hit_rate']:.0%}), {cache['evictions']} descartes; "
+                 f"{cache['entries']} entradas, {cache['bytes'] / 2**20:.1f} de {cache['max_bytes'] / 2**20:.0f} MB")
+
+        st.write("Chamadas mais lentas deste rerun:")
+        st.dataframe(_calls_table(record['calls']), hide_index=True)
+
+        st.write("Percentis ao longo dos reruns:")
+        st.dataframe(rolling_percentiles(st.session_state.get('_diagnostics_history', {})), hide_index=True)
+
+        etl = _background_records.get('etl')
+        if etl is not None:
+            st.write(f"Última atualização dos dados ({etl['timestamp']}): {etl.get('status')}, "
+                     f"{etl['total_seconds']:.1f} s, versão {etl.get('version')}")
+            st.dataframe(_calls_table(etl['calls']), hide_index=True)
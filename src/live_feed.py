@@ -0,0 +1,152 @@
+import io
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from src.aggregates import (
+    build_metrics_cube, build_deliverer_cells, merge_cells, CUBE_DIMENSIONS, DELIVERER_DIMENSIONS
+)
+from src.data_processing import transform
+
+logger = logging.getLogger(__name__)
+
+# Modo ao vivo: caminho de um feed de pedidos que só cresce (CSV com cabeçalho ou
+# JSON lines), lido pela variável de ambiente CURRY_LIVE_FEED; vazio desliga o modo
+LIVE_FEED_PATH = os.environ.get('CURRY_LIVE_FEED', '').strip()
+# Intervalo de atualização das métricas ao vivo (segundos)
+LIVE_REFRESH_SECONDS = 5
+# Bytes lidos do feed por micro-lote (limita a memória ao alcançar um feed atrasado)
+MAX_BATCH_BYTES = 8 * 2**20
+
+def parse_feed_lines(lines, header=None, jsonl=False):
+    """Linhas brutas do feed -> DataFrame bruto (CSV: `header` é a linha de cabeçalho)."""
+    if jsonl:
+        # Sem conversão de tipos: os valores passam pelas mesmas regras de limpeza do CSV
+        return pd.read_json(io.BytesIO(lines), lines=True, dtype=False, convert_dates=False)
+    return pd.read_csv(io.BytesIO(header + lines))
+
+def empty_state():
+    """Estado inicial dos agregados corridos."""
+    return {'cube': None, 'deliverers': None, 'orders': 0, 'rejected': 0, 'batches': 0, 'updated': None}
+
+def merge_batch(state, df_clean, rejected=0):
+    """Novo estado com um micro-lote já transformado combinado aos agregados corridos.
+
+    Só as células do lote são calculadas; a combinação soma contagens, somas e
+    somas dos quadrados por célula (médias e variâncias saem de rollup).
+    """
+    cube = build_metrics_cube(df_clean)
+    deliverers = build_deliverer_cells(df_clean)
+    if state['cube'] is not None:
+        cube = merge_cells([state['cube'], cube], CUBE_DIMENSIONS)
+        deliverers = merge_cells([state['deliverers'], deliverers], DELIVERER_DIMENSIONS)
+    return {
+        'cube': cube,
+        'deliverers': deliverers,
+        'orders': state['orders'] + len(df_clean),
+        'rejected': state['rejected'] + rejected,
+        'batches': state['batches'] + 1,
+        'updated': datetime.now(),
+    }
+
+class LiveFeed:
+    """Acompanha o feed a partir do último byte lido e mantém os agregados corridos.
+
+    Cada poll lê só as linhas completas acrescentadas desde a chamada anterior
+    (uma linha sem quebra no fim espera o próximo poll), aplica o transform a
+    esse micro-lote e combina o resultado ao estado. Uma linha maior que
+    MAX_BATCH_BYTES é descartada (com aviso). Um feed truncado ou substituído
+    (menor que a posição lida) recomeça do início.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = path.lower().endswith(('.jsonl', '.ndjson'))
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._header = None # Linha de cabeçalho do CSV
+        self._skipping = False # No meio de uma linha grande demais (descartada até a quebra)
+        self._state = empty_state()
+
+    def poll(self):
+        """Processa as linhas novas do feed; retorna o número de pedidos novos (após a limpeza)."""
+        with self._lock:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                return 0
+            if size < self._offset:
+                logger.warning("Feed %s encolheu: recomeçando do início", self.path)
+                self._offset, self._header, self._skipping, self._state = 0, None, False, empty_state()
+            new_orders = 0
+            while self._offset < size:
+                lines = self._read_lines()
+                if lines is None:
+                    break
+                if lines:
+                    new_orders += self._apply(lines)
+            return new_orders
+
+    def _read_lines(self):
+        """Próximo bloco de linhas completas (no máximo MAX_BATCH_BYTES).
+
+        Retorna None se não há linha completa nova, e b'' se a posição só avançou
+        (cabeçalho, linhas em branco ou parte de uma linha descartada).
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read(MAX_BATCH_BYTES)
+        if self._skipping:
+            # Resto da linha grande demais: descartado até a próxima quebra de linha
+            newline = chunk.find(b'\n')
+            self._offset += len(chunk) if newline < 0 else newline + 1
+            self._skipping = newline < 0
+            return b'' if chunk else None
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            if len(chunk) < MAX_BATCH_BYTES:
+                return None # Linha ainda incompleta: espera o próximo poll
+            # Nenhuma quebra na janela inteira: a linha nunca caberia num micro-lote
+            logger.warning("Linha do feed %s maior que %d bytes (posição %d): descartada",
+                           self.path, MAX_BATCH_BYTES, self._offset)
+            self._offset += len(chunk)
+            self._skipping = True
+            self._state = {**self._state, 'rejected': self._state['rejected'] + 1}
+            return b''
+        self._offset += end
+        lines = chunk[:end]
+        if not self.jsonl and self._header is None:
+            header_end = lines.index(b'\n') + 1
+            self._header, lines = lines[:header_end], lines[header_end:]
+        return lines if lines.strip() else b''
+
+    def _apply(self, lines):
+        """Transforma um micro-lote e o combina ao estado (lotes inválidos são descartados)."""
+        start = time.perf_counter()
+        try:
+            df_raw = parse_feed_lines(lines, self._header, self.jsonl)
+            df_clean, report = transform(df_raw, report=True)
+        except Exception:
+            logger.exception("Micro-lote inválido no feed %s (descartado)", self.path)
+            return 0
+        if len(df_clean):
+            self._state = merge_batch(self._state, df_clean, report['rows_in'] - report['rows_out'])
+        else:
+            self._state = {**self._state, 'rejected': self._state['rejected'] + report['rows_in']}
+        logger.info("Feed: %d pedidos novos em %.3fs", len(df_clean), time.perf_counter() - start)
+        return len(df_clean)
+
+    def state(self):
+        """Agregados corridos atuais (o dicionário nunca é alterado depois de publicado)."""
+        with self._lock:
+            return self._state
+
+@st.cache_resource
+def get_live_feed(path=LIVE_FEED_PATH):
+    """Leitor único do feed no processo do servidor (None se o modo ao vivo estiver desligado)."""
+    return LiveFeed(path) if path else None
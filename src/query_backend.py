@@ -0,0 +1,131 @@
+import importlib.util
+import logging
+import os
+import threading
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from src.aggregates import ORDERS_COLUMN, AGE_BINS, AGE_LABELS, DISTINCT_COLUMNS
+from src.data_processing import prune_partition_files
+from src.result_cache import tag_for_cache
+
+logger = logging.getLogger(__name__)
+
+# Backend das agregações, escolhido pela variável de ambiente CURRY_QUERY_BACKEND:
+#   pandas (padrão) -> seleções em memória (índices de filtragem, cubo e sketches)
+#   duckdb          -> consultas SQL sobre os Parquet processados; dependência opcional
+#                      (requirements-duckdb.txt): sem o pacote instalado, volta para o pandas
+QUERY_BACKEND = os.environ.get('CURRY_QUERY_BACKEND', 'pandas').strip().lower()
+# Chave marcando um dicionário como seleção SQL (arquivos + predicado dos filtros)
+SELECTION_FILES = 'parquet_files'
+# Leitura dos arquivos da seleção: as colunas de partição já estão nos arquivos (os diretórios
+# 'Order_Date=...' não viram colunas) e schemas de blocos diferentes são unidos pelo nome
+PARQUET_SOURCE = "read_parquet(?, hive_partitioning = false, union_by_name = true)"
+
+_connection_lock = threading.Lock()
+_connection = None
+
+@lru_cache(maxsize=None)
+def sql_backend_enabled():
+    """Indica se as agregações são feitas em SQL (DuckDB); avisa uma vez se o pacote faltar."""
+    if QUERY_BACKEND != 'duckdb':
+        return False
+    if importlib.util.find_spec('duckdb') is None:
+        logger.warning("CURRY_QUERY_BACKEND=duckdb, mas o pacote duckdb não está instalado: usando o pandas")
+        return False
+    return True
+
+def _cursor():
+    """Cursor próprio da chamada sobre a conexão em memória do processo (um por thread/sessão)."""
+    global _connection
+    with _connection_lock:
+        if _connection is None:
+            import duckdb
+            # Rodapés dos Parquet em cache: cada consulta abre todas as partições selecionadas
+            # (seguro: os arquivos de uma versão publicada nunca são reescritos)
+            _connection = duckdb.connect()
+            _connection.execute("SET parquet_metadata_cache = true")
+        return _connection.cursor()
+
+def quote(column):
+    """Nome de coluna entre aspas (ex.: "Time_taken(min)")."""
+    return '"' + column.replace('"', '""') + '"'
+
+def is_selection(df):
+    """Indica se o argumento é uma seleção SQL (e não um DataFrame)."""
+    return isinstance(df, dict) and SELECTION_FILES in df
+
+def filter_predicate(filters, filter_columns):
+    """Traduz os filtros da barra lateral em (condição SQL, parâmetros).
+
+    Mesma semântica de apply_filters: período com o último dia inteiro e, em cada
+    dimensão, só os valores selecionados (nulos nunca passam).
+    """
+    start, end = filters['date_range']
+    conditions = [f"{quote('Order_Date')} >= ?", f"{quote('Order_Date')} < ?"]
+    params = [datetime.combine(start, time()), datetime.combine(end, time()) + timedelta(days=1)]
+    for arg, col in filter_columns.items():
+        values = sorted(set(filters[arg]))
+        if not values:
+            conditions.append('FALSE')
+            continue
+        conditions.append(f"{quote(col)} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    return ' AND '.join(conditions), params
+
+def select_filtered(parquet_files, dataset_version, filters, filter_columns):
+    """Seleções SQL no formato de filter_data: cada item é a mesma seleção marcada para o cache.
+
+    As funções de agregação reconhecem a seleção (is_selection) e executam a
+    consulta agregada correspondente; as contagens de distintos são exatas, sem sketches.
+    Só os arquivos das partições de data e cidade selecionadas entram na consulta.
+    """
+    where, params = filter_predicate(filters, filter_columns)
+    files = prune_partition_files(parquet_files, filters['date_range'], filters.get('cities'))
+    # Nenhuma partição selecionada: um arquivo qualquer mantém as colunas (o predicado não seleciona nada)
+    files = files or list(parquet_files[:1])
+    selection = tag_for_cache({SELECTION_FILES: tuple(files), 'where': where, 'params': tuple(params)},
+                              dataset_version, filters, 'sql')
+    return {
+        'orders': selection,
+        'cube': selection,
+        'deliverers': selection,
+        'distinct': {col: None for col in DISTINCT_COLUMNS},
+        'quantiles': selection,
+    }
+
+def query(selection, columns, group_by=(), where=(), params=()):
+    """Executa SELECT `columns` sobre a seleção, com condições extras, agrupado e ordenado por `group_by`.
+
+    `columns`, `group_by` e `where` são expressões SQL; retorna um DataFrame.
+    """
+    conditions = [selection['where'], *where]
+    sql = f"SELECT {', '.join(columns)} FROM {PARQUET_SOURCE} WHERE {' AND '.join(f'({c})' for c in conditions)}"
+    if group_by:
+        positions = ', '.join(str(i + 1) for i in range(len(group_by)))
+        sql += f" GROUP BY {positions} ORDER BY {positions}"
+    values = [list(selection[SELECTION_FILES]), *selection['params'], *params]
+    return _cursor().execute(sql, values).df()
+
+def query_cube(selection, by, measures, where=None):
+    """Cubo (formato de build_metrics_cube) agregado só pelas colunas `by`, calculado no DuckDB.
+
+    `where` opcional: (coluna, valor) para restringir às linhas com coluna == valor.
+    """
+    columns = [quote(col) for col in by] + [f"count(*) AS {quote(ORDERS_COLUMN)}"]
+    for measure in measures:
+        x = f"CAST({quote(measure)} AS DOUBLE)"
+        columns += [f"count({x}) AS {quote(f'{measure}|count')}",
+                    f"coalesce(sum({x}), 0) AS {quote(f'{measure}|sum')}",
+                    f"coalesce(sum({x} * {x}), 0) AS {quote(f'{measure}|sumsq')}"]
+    conditions, params = [], []
+    if where is not None:
+        conditions.append(f"{quote(where[0])} = ?")
+        params.append(where[1])
+    return query(selection, columns, group_by=[quote(col) for col in by], where=conditions, params=params)
+
+def age_group_sql(column):
+    """Expressão SQL da faixa etária (mesmos intervalos de age_groups)."""
+    cases = ' '.join(f"WHEN {quote(column)} >= {low} AND {quote(column)} < {high} THEN '{label}'"
+                     for low, high, label in zip(AGE_BINS[:-1], AGE_BINS[1:], AGE_LABELS))
+    return f"CASE {cases} END"
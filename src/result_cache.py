@@ -0,0 +1,154 @@
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import pandas as pd
+import streamlit as st
+
+# Orçamento de memória do cache de resultados (compartilhado por páginas e sessões)
+RESULT_CACHE_MAX_BYTES = 128 * 2**20
+# Atributo (DataFrame.attrs) com a chave de cache de um DataFrame filtrado
+RESULT_KEY_ATTR = 'result_cache_key'
+
+class ResultCache:
+    """Cache LRU de resultados com limite de memória e contadores de acerto/erro."""
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # chave -> (valor, tamanho em bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        """Retorna o valor em cache para `key` ou o calcula e armazena."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return value # Maior que o orçamento inteiro: não armazena
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._bytes -= evicted_size
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        """Remove todas as entradas (os contadores são mantidos)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Contadores e ocupação atuais do cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+def estimate_size(value):
+    """Tamanho aproximado (bytes) de um resultado."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+@st.cache_resource
+def get_result_cache():
+    """Instância única do cache no processo do servidor."""
+    return ResultCache()
+
+def normalize_filters(filters):
+    """Estado dos filtros em forma canônica (ordem das seleções não importa)."""
+    normalized = []
+    for name, value in sorted(filters.items()):
+        if name == 'date_range':
+            normalized.append((name, tuple(str(d) for d in value)))
+        else:
+            normalized.append((name, tuple(sorted(str(v) for v in value))))
+    return tuple(normalized)
+
+def tag_for_cache(df, dataset_version, filters, source):
+    """Marca um DataFrame filtrado (ou uma seleção) com a chave (versão dos dados, filtros, origem)."""
+    if isinstance(df, dict):
+        # Seleção de linhas ou SQL: imutável, a chave não depende de linhas/colunas
+        df[RESULT_KEY_ATTR] = (dataset_version, normalize_filters(filters), source)
+        return df
+    df.attrs[RESULT_KEY_ATTR] = (dataset_version, normalize_filters(filters), source,
+                                 len(df), tuple(df.columns))
+    return df
+
+def _frame_key(df):
+    """Chave de um DataFrame marcado; None se não marcado ou derivado (linhas/colunas mudaram)."""
+    key = df.attrs.get(RESULT_KEY_ATTR)
+    if key is None or key[3] != len(df) or key[4] != tuple(df.columns):
+        return None
+    return key[:3]
+
+def _arg_key(value):
+    """Parte da chave de cache de um argumento; None se o argumento não for cacheável."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return ('value', value)
+    if isinstance(value, (list, tuple)) and all(isinstance(v, (str, int, float, bool)) for v in value):
+        return ('value', tuple(value))
+    if isinstance(value, pd.DataFrame):
+        key = _frame_key(value)
+        return None if key is None else ('frame', key)
+    if isinstance(value, dict) and RESULT_KEY_ATTR in value:
+        return ('frame', value[RESULT_KEY_ATTR])
+    if isinstance(value, dict):
+        parts = tuple((k, _arg_key(v)) for k, v in sorted(value.items()))
+        return None if any(part is None for _, part in parts) else ('dict', parts)
+    return None
+
+def _copy_result(value):
+    """Cópia defensiva: o chamador pode alterar o resultado sem afetar o cache."""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, tuple):
+        return tuple(_copy_result(v) for v in value)
+    return value
+
+def memoize_result(func):
+    """Memoriza `func` no cache compartilhado, com a chave (função, filtros, versão, parâmetros).
+
+    Só há cache quando todos os DataFrames recebidos foram marcados com tag_for_cache;
+    caso contrário a função é executada normalmente.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        arg_parts = tuple(_arg_key(arg) for arg in args)
+        kwarg_parts = tuple((k, _arg_key(v)) for k, v in sorted(kwargs.items()))
+        if None in arg_parts or any(part is None for _, part in kwarg_parts):
+            return func(*args, **kwargs)
+        key = (name, arg_parts, kwarg_parts)
+        return _copy_result(get_result_cache().get_or_compute(key, lambda: func(*args, **kwargs)))
+    return wrapper
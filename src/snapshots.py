@@ -0,0 +1,275 @@
+"""Pré-cálculo dos resultados das páginas para presets de filtros (snapshots).
+
+Executa o ETL uma vez, calcula as métricas, tabelas e gráficos das três páginas
+para cada preset em processos paralelos e grava um pacote versionado em
+data/processed/snapshots/<versão dos dados>/. Quando os filtros da barra lateral
+coincidem com um preset, as páginas leem o snapshot em vez de calcular.
+
+Uso (a partir da raiz do repositório):
+    python -m src.snapshots --workers 2
+    python -m src.snapshots --presets presets.json
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+
+import streamlit as st
+
+from src import aggregates, query_backend, utils, visualizations
+from src.diagnostics import timed
+from src.result_cache import normalize_filters
+from src.utils import load_dashboard_data, default_filters, filter_data
+from src.visualizations import (
+    get_company_key_metrics, plot_orders_by_date, plot_traffic_order_share, plot_traffic_order_city,
+    get_country_map, plot_order_types_distribution, plot_time_by_order_type_and_traffic,
+    get_delivery_key_metrics, get_delivery_rating_by_traffic, get_delivery_rating_by_weather,
+    get_fastest_and_slowest_deliverers, get_deliverer_profiles, plot_delivery_age_distribution,
+    plot_delivery_ratings_distribution, plot_time_taken_by_vehicle_condition,
+    plot_deliveries_by_age_group_and_city, get_restaurant_key_metrics, plot_avg_std_time_by_city,
+    get_avg_std_time_by_city_and_order_type, plot_avg_std_time_by_city_and_traffic,
+    plot_distance_by_vehicle_type, get_avg_rating_by_weather_condition, get_time_percentiles,
+    plot_time_percentiles, PERCENTILE_DIMENSIONS
+)
+
+logger = logging.getLogger(__name__)
+
+# Pacotes de snapshots: <SNAPSHOT_DIR>/<versão dos dados>/{bundle.json, <preset>.pkl}
+SNAPSHOT_DIR = 'data/processed/snapshots'
+BUNDLE_FILE = 'bundle.json'
+# Snapshots lidos mantidos em memória (compartilhados entre sessões)
+SNAPSHOT_CACHE_ENTRIES = 16
+
+# Presets: alterações sobre os filtros iniciais da barra lateral (default_filters)
+FILTER_PRESETS = {
+    'padrao': {},
+    'metropolitana': {'cities': ['Metropolitian']},
+    'urbana': {'cities': ['Urban']},
+    'semi_urbana': {'cities': ['Semi-Urban']},
+    'transito_intenso': {'traffic': ['High', 'Jam']},
+}
+
+# Itens de cada página, calculados a partir das seleções filtradas (ver filter_data).
+# O mapa de densidade depende da vista do navegador e é sempre calculado na página.
+PAGE_ITEMS = {
+    'Empresa': {
+        'metrics': lambda f: get_company_key_metrics(f['orders'], cube=f['cube'], sketches=f['distinct']),
+        'orders_by_date': lambda f: plot_orders_by_date(f['cube']),
+        'traffic_share': lambda f: plot_traffic_order_share(f['cube']),
+        'traffic_city': lambda f: plot_traffic_order_city(f['cube']),
+        'country_map': lambda f: get_country_map(f['orders']),
+        'order_types': lambda f: plot_order_types_distribution(f['cube']),
+        'time_by_order_type_and_traffic': lambda f: plot_time_by_order_type_and_traffic(f['cube']),
+    },
+    'Entregadores': {
+        'metrics': lambda f: get_delivery_key_metrics(f['orders'], cube=f['cube'], sketches=f['distinct']),
+        'rating_by_traffic': lambda f: get_delivery_rating_by_traffic(f['cube']),
+        'rating_by_weather': lambda f: get_delivery_rating_by_weather(f['cube']),
+        'fastest_and_slowest': lambda f: get_fastest_and_slowest_deliverers(f['deliverers'], top_n=10),
+        'age_distribution': lambda f: plot_delivery_age_distribution(f['orders']),
+        'ratings_distribution': lambda f: plot_delivery_ratings_distribution(f['orders']),
+        'time_by_vehicle_condition': lambda f: plot_time_taken_by_vehicle_condition(f['cube']),
+        'age_group_and_city': lambda f: plot_deliveries_by_age_group_and_city(f['orders']),
+        'deliverer_profiles': lambda f: get_deliverer_profiles(f['deliverers']),
+    },
+    'Restaurantes': {
+        'metrics': lambda f: get_restaurant_key_metrics(f['orders'], cube=f['cube'], sketches=f['distinct']),
+        'time_by_city_and_traffic': lambda f: plot_avg_std_time_by_city_and_traffic(f['cube']),
+        'time_by_city': lambda f: plot_avg_std_time_by_city(f['cube']),
+        'time_by_city_and_order_type': lambda f: get_avg_std_time_by_city_and_order_type(f['cube']),
+        'distance_by_vehicle': lambda f: plot_distance_by_vehicle_type(f['cube']),
+        'rating_by_weather': lambda f: get_avg_rating_by_weather_condition(f['cube']),
+        'time_percentiles': lambda f: get_time_percentiles(f['quantiles']),
+        # Um gráfico de percentis por dimensão do seletor da página
+        **{f'time_percentiles_by:{dim}': (lambda f, dim=dim: plot_time_percentiles(f['quantiles'], dim))
+           for dim in PERCENTILE_DIMENSIONS},
+    },
+}
+
+@lru_cache(maxsize=None)
+def snapshot_code_version():
+    """Hash do código que produz os itens: qualquer mudança invalida os snapshots"""
+    digest = hashlib.sha256()
+    for module in (aggregates, query_backend, utils, visualizations):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+def filters_key(filters):
+    """Chave curta do estado dos filtros (a ordem das seleções não importa)."""
+    payload = json.dumps(normalize_filters(filters)).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+def resolve_preset(index, overrides):
+    """Filtros completos de um preset: filtros iniciais com as alterações do preset."""
+    filters = default_filters(index)
+    for name, value in overrides.items():
+        if name == 'date_range':
+            value = tuple(date.fromisoformat(str(d)) for d in value)
+        filters[name] = value
+    return filters
+
+def compute_page_items(filtered, pages=PAGE_ITEMS):
+    """Calcula todos os itens das páginas para uma seleção filtrada ({página: {item: valor}})."""
+    return {page: {name: item(filtered) for name, item in items.items()}
+            for page, items in pages.items()}
+
+def serialize_items(page_items):
+    """Serializa cada item em separado (a página só decodifica os itens da análise exibida)."""
+    return {page: {name: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) for name, value in items.items()}
+            for page, items in page_items.items()}
+
+def _write_pickle_atomic(value, path):
+    """Grava um pickle via arquivo temporário + rename."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+# Dados do processo de pré-cálculo (carregados uma vez por processo)
+_worker_data = None
+
+def _init_worker():
+    """Inicializador dos processos: lê os dados processados (cache do ETL em disco)."""
+    global _worker_data
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    _worker_data = load_dashboard_data()
+
+def _render_preset(name, filters, path):
+    """Calcula e grava o snapshot de um preset; retorna (nome, segundos, bytes)."""
+    start = time.perf_counter()
+    items = compute_page_items(filter_data(_worker_data, filters))
+    _write_pickle_atomic(serialize_items(items), path)
+    return name, time.perf_counter() - start, os.path.getsize(path)
+
+def build_snapshots(presets=FILTER_PRESETS, snapshot_dir=SNAPSHOT_DIR, workers=None):
+    """Executa o ETL e grava o pacote de snapshots dos presets; retorna o bundle (None sem dados).
+
+    Cada preset vira um pickle com os itens das três páginas; o bundle.json,
+    gravado por último, só torna o pacote visível quando ele está completo.
+    """
+    global _worker_data
+    data = load_dashboard_data()
+    if data is None:
+        return None
+    bundle_dir = os.path.join(snapshot_dir, data['dataset_version'])
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    bundle = {
+        'dataset_version': data['dataset_version'],
+        'code_version': snapshot_code_version(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'presets': {},
+    }
+    jobs = []
+    for name, overrides in presets.items():
+        filters = resolve_preset(data['filter_index'], overrides)
+        jobs.append((name, filters, os.path.join(bundle_dir, f'{name}.pkl')))
+        bundle['presets'][filters_key(filters)] = {'name': name, 'file': f'{name}.pkl',
+                                                   'filters': normalize_filters(filters)}
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        _worker_data = data
+        results = [_render_preset(*job) for job in jobs]
+    else:
+        del data # Cada processo lê os próprios dados do cache do ETL
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker) as executor:
+            results = list(executor.map(_render_preset, *zip(*jobs)))
+    for name, seconds, size in results:
+        logger.info("Snapshot '%s': %.2fs, %.1f KB", name, seconds, size / 1024)
+
+    path = os.path.join(bundle_dir, BUNDLE_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, indent=2)
+    os.replace(tmp_path, path)
+    return bundle
+
+# Leitura pelas páginas
+@st.cache_resource(max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _read_bundle(path, mtime_ns):
+    """Lê um bundle.json (a mtime na chave recarrega o arquivo quando ele muda)."""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+@st.cache_resource(max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _read_snapshot(path, mtime_ns):
+    """Lê o pickle de um preset: itens ainda serializados, compartilhados entre sessões."""
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def find_snapshot(version, filters, snapshot_dir=SNAPSHOT_DIR):
+    """Itens pré-calculados (serializados) para os filtros, se eles coincidirem com um preset."""
+    bundle_dir = os.path.join(snapshot_dir, version)
+    path = os.path.join(bundle_dir, BUNDLE_FILE)
+    try:
+        bundle = _read_bundle(path, os.stat(path).st_mtime_ns)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if bundle.get('code_version') != snapshot_code_version():
+        return None
+    entry = bundle['presets'].get(filters_key(filters))
+    if entry is None:
+        return None
+    path = os.path.join(bundle_dir, entry['file'])
+    try:
+        with timed('snapshots.read_snapshot'):
+            return _read_snapshot(path, os.stat(path).st_mtime_ns)
+    except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+        return None
+
+def page_results(page, data, filters):
+    """Função que retorna os itens da página pelo nome: do snapshot do preset ou calculados.
+
+    `data` é a versão dos dados usada no rerun (load_session_data). Os filtros
+    só são aplicados se algum item não estiver no snapshot; nomes fora de
+    PAGE_ITEMS retornam as seleções filtradas ('orders', 'cube', ...).
+    """
+    snapshot = find_snapshot(data['dataset_version'], filters)
+    items = snapshot.get(page, {}) if snapshot is not None else {}
+    filtered = {}
+
+    def result(name):
+        if name in items:
+            # Cada leitura devolve uma cópia nova: a sessão pode alterá-la à vontade
+            return pickle.loads(items[name])
+        if not filtered:
+            filtered.update(filter_data(data, filters))
+        if name in PAGE_ITEMS[page]:
+            return PAGE_ITEMS[page][name](filtered)
+        return filtered[name]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--presets', help='JSON {nome: alterações dos filtros} (padrão: FILTER_PRESETS)')
+    parser.add_argument('--output-dir', default=SNAPSHOT_DIR)
+    parser.add_argument('--workers', type=int, default=None, help='processos paralelos (padrão: núcleos da CPU)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # O Streamlit avisa que não há sessão ativa a cada chamada; irrelevante aqui
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    presets = FILTER_PRESETS
+    if args.presets:
+        with open(args.presets, encoding='utf-8') as f:
+            presets = json.load(f)
+
+    start = time.perf_counter()
+    bundle = build_snapshots(presets, snapshot_dir=args.output_dir, workers=args.workers)
+    if bundle is None:
+        raise SystemExit("Dados brutos não encontrados; nada a pré-calcular.")
+    print(f"{len(bundle['presets'])} presets gravados em "
+          f"{os.path.join(args.output_dir, bundle['dataset_version'])} ({time.perf_counter() - start:.1f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,45 @@ import streamlit as st
 from datetime import datetime
 from PIL import Image
 import pandas as pd
+import numpy as np
+import os
+import glob
+from src.data_processing import (
+    run_etl, run_incremental_etl, read_store, read_store_aggregates, read_processed,
+    read_fingerprint, read_last_good, read_manifest, is_cache_valid, dataset_version, processed_files,
+    read_current_version, store_files, CURRENT_FILE
+)
+from src.aggregates import build_aggregates, row_selection, SKETCH_DIMENSIONS
+from src.result_cache import tag_for_cache
+from src.background_etl import BackgroundETL
+from src.query_backend import sql_backend_enabled, select_filtered
+from src.live_feed import get_live_feed, LIVE_REFRESH_SECONDS
+from src.visualizations import get_live_key_metrics, get_live_time_by_city_and_traffic
+from src.diagnostics import instrumented, register_shared_memory
 
-def setup_sidebar(df_input):
-    """Configura a barra lateral com filtros interativos para o dashboard."""
-    df1 = df_input.copy()
+# Caminhos do pipeline ETL usados pelas páginas
+RAW_DATA_PATH = 'data/raw/curry_company_dataset.csv'
+# Diretório do Parquet particionado por data e cidade (versões + ponteiro da versão publicada)
+PROCESSED_DATA_PATH = 'data/processed/curry_company_processed.parquet'
+# Modo incremental: se o diretório de lotes existir, só os lotes novos são processados
+RAW_BATCH_DIR = 'data/raw/batches'
+PROCESSED_STORE_DIR = 'data/processed/store'
+# Linhas por bloco do ETL em streaming (variável de ambiente CURRY_ETL_CHUNKSIZE); vazio ou 0
+# processa o arquivo bruto inteiro em memória. Limita só o pico do extract/transform: as
+# páginas ainda carregam os pedidos processados (schema compacto) para os índices de filtragem
+ETL_CHUNKSIZE = int(os.environ.get('CURRY_ETL_CHUNKSIZE', '').strip() or 0)
+
+# Dimensões filtráveis na barra lateral (argumento de apply_filters -> coluna)
+FILTER_COLUMNS = {
+    'cities': 'City',
+    'traffic': 'Road_traffic_density',
+    'weather': 'Weatherconditions',
+    'vehicle': 'Type_of_vehicle',
+}
+
+@instrumented
+def sidebar_filters(df1, index=None):
+    """Desenha a barra lateral e retorna os filtros selecionados (argumentos de apply_filters)."""
 
     # --- Seção do Logo e Título ---
     st.sidebar.markdown(' ') 
@@ -24,11 +59,12 @@ def setup_sidebar(df_input):
 
     # --- Filtro de Data ---
     st.sidebar.markdown("### Período")
-    # Garante que a coluna Order_Date seja datetime para min/max
-    if not pd.api.types.is_datetime64_any_dtype(df1['Order_Date']):
-        df1['Order_Date'] = pd.to_datetime(df1['Order_Date'], errors='coerce')
+    # Garante que a coluna Order_Date seja datetime para min/max (sem alterar df1)
+    order_dates = df1['Order_Date']
+    if not pd.api.types.is_datetime64_any_dtype(order_dates):
+        order_dates = pd.to_datetime(order_dates, errors='coerce')
     
-    valid_dates = df1['Order_Date'].dropna()
+    valid_dates = order_dates.dropna()
     if not valid_dates.empty:
         min_date_data = valid_dates.min().date() 
         max_date_data = valid_dates.max().date() 
@@ -51,7 +87,7 @@ def setup_sidebar(df_input):
     # Filtro de Cidade
     with st.sidebar.expander("Cidade", expanded=True): 
         st.write("Selecione os tipos de cidade:")
-        cities_options = df1['City'].unique().tolist()
+        cities_options = filter_options(df1, 'City', index)
         cities_options = [c for c in cities_options if pd.notna(c) and c != 'NaN']
         
         cities = st.multiselect(
@@ -65,7 +101,7 @@ def setup_sidebar(df_input):
     # Filtro de Tráfego
     with st.sidebar.expander("Condição de Trânsito"):
         st.write("Selecione as condições de tráfego:")
-        traffic_options = df1['Road_traffic_density'].unique().tolist()
+        traffic_options = filter_options(df1, 'Road_traffic_density', index)
         traffic_options = [t for t in traffic_options if pd.notna(t) and t != 'NaN'] # Remove 'NaN'
         
         traffic = st.multiselect(
@@ -79,7 +115,7 @@ def setup_sidebar(df_input):
     # Filtro de Clima
     with st.sidebar.expander("Condição Climática"):
         st.write("Selecione as condições climáticas:")
-        weather_options = df1['Weatherconditions'].unique().tolist()
+        weather_options = filter_options(df1, 'Weatherconditions', index)
         weather_options = [w for w in weather_options if pd.notna(w) and w != 'NaN'] # Remove 'NaN'
         
         weather = st.multiselect(
@@ -93,7 +129,7 @@ def setup_sidebar(df_input):
     # Filtro de Veículo
     with st.sidebar.expander("Tipo de Veículo"):
         st.write("Selecione os tipos de veículo:.")
-        vehicle_options = df1['Type_of_vehicle'].unique().tolist()
+        vehicle_options = filter_options(df1, 'Type_of_vehicle', index)
         vehicle_options = [v for v in vehicle_options if pd.notna(v) and v != 'NaN'] # Remove 'NaN'
         
         vehicle = st.multiselect(
@@ -104,23 +140,336 @@ def setup_sidebar(df_input):
         )
         st.write("---")
 
-    # Retorna o DataFrame filtrado
-    df_filtered = apply_filters(df1, date_range, traffic, weather, vehicle, cities)
+    return {
+        'date_range': date_range,
+        'traffic': traffic,
+        'weather': weather,
+        'vehicle': vehicle,
+        'cities': cities,
+    }
+
+def _processed_at():
+    """Data e hora em que a versão processada em disco foi gravada."""
+    output = PROCESSED_STORE_DIR if os.path.isdir(RAW_BATCH_DIR) else PROCESSED_DATA_PATH
+    path = os.path.join(output, CURRENT_FILE)
+    return datetime.fromtimestamp(os.path.getmtime(path)) if os.path.exists(path) else datetime.now()
+
+def processed_parquet_files(store_version=None):
+    """Arquivos Parquet com os pedidos processados (partições da versão publicada ou do armazenamento)."""
+    if os.path.isdir(RAW_BATCH_DIR):
+        return store_files(PROCESSED_STORE_DIR, store_version)
+    return processed_files(PROCESSED_DATA_PATH)
+
+def _build_dashboard_data(df_clean, aggregates, metadata, progress=None, store_version=None):
+    """Monta os dados e índices das páginas a partir dos pedidos processados e dos agregados."""
+    if progress is not None:
+        progress(0.85, "Construindo os índices de filtragem")
+    filter_index = build_filter_index(df_clean)
+    return {
+        # Versão dos dados na chave do cache de resultados (compartilhado entre sessões)
+        'dataset_version': dataset_version(metadata) if metadata else f'process-{id(df_clean)}',
+        'processed_at': _processed_at(),
+        # Arquivos lidos pelo backend SQL (src/query_backend.py)
+        'parquet_files': processed_parquet_files(store_version),
+        'filter_index': filter_index,
+        'df_processed': filter_index['df'],
+        # O cubo tem as mesmas colunas de filtro, então usa o mesmo tipo de índice
+        'cube_index': build_filter_index(aggregates['cube']),
+        # Estatísticas por entregador e célula, para ranking e perfil sem varrer os pedidos
+        'deliverer_index': build_filter_index(aggregates['deliverers']),
+        # Sketches de distintos por célula, filtráveis pelas dimensões que têm (SKETCH_DIMENSIONS)
+        'sketch_indexes': {col: build_filter_index(sketch) for col, sketch in aggregates['distinct'].items()},
+        # Histogramas do tempo de entrega para os percentis
+        'quantile_index': build_filter_index(aggregates['quantiles']),
+    }
+
+@instrumented
+def load_dashboard_data(progress=None):
+    """Executa o ETL e monta os dados e índices usados pelas páginas (None se indisponível).
+
+    `progress` recebe (fração, mensagem) a cada etapa.
+    """
+    store_version = None
+    if os.path.isdir(RAW_BATCH_DIR):
+        run_incremental_etl(RAW_BATCH_DIR, PROCESSED_STORE_DIR, progress=progress)
+        # Pedidos, agregados e manifesto lidos da mesma versão publicada
+        store_version = read_current_version(PROCESSED_STORE_DIR)
+        df_clean = read_store(PROCESSED_STORE_DIR, store_version)
+        aggregates = read_store_aggregates(PROCESSED_STORE_DIR, store_version) if df_clean is not None else None
+        metadata = read_manifest(PROCESSED_STORE_DIR, store_version)
+    else:
+        df_clean = run_etl(input_path=RAW_DATA_PATH, output_path=PROCESSED_DATA_PATH,
+                           chunksize=ETL_CHUNKSIZE or None, progress=progress)
+        if df_clean is not None and progress is not None:
+            progress(0.7, "Calculando os agregados")
+        aggregates = build_aggregates(df_clean) if df_clean is not None else None
+        metadata = read_fingerprint(PROCESSED_DATA_PATH)
+    if df_clean is None:
+        return None
+    return _build_dashboard_data(df_clean, aggregates, metadata, progress, store_version)
+
+def load_last_good_data():
+    """Última versão completa já gravada em disco, sem executar o ETL.
+
+    Retorna (dados, stamp): stamp é data_source_stamp() se a versão corresponde
+    às entradas atuais, ou None se ela precisa ser atualizada.
+    """
+    if os.path.isdir(RAW_BATCH_DIR):
+        # Só versões completas são publicadas; todas as leituras usam a mesma
+        store_version = read_current_version(PROCESSED_STORE_DIR)
+        metadata = read_manifest(PROCESSED_STORE_DIR, store_version)
+        df_clean = read_store(PROCESSED_STORE_DIR, store_version) if metadata['batches'] else None
+        if df_clean is None:
+            return None, None
+        aggregates = read_store_aggregates(PROCESSED_STORE_DIR, store_version)
+        return _build_dashboard_data(df_clean, aggregates, metadata, store_version=store_version), None
+
+    metadata = read_last_good(PROCESSED_DATA_PATH)
+    if metadata is None:
+        return None, None
+    df_clean = read_processed(PROCESSED_DATA_PATH)
+    data = _build_dashboard_data(df_clean, build_aggregates(df_clean), metadata)
+    current = os.path.exists(RAW_DATA_PATH) and is_cache_valid(RAW_DATA_PATH, PROCESSED_DATA_PATH)
+    return data, (data_source_stamp() if current else None)
+
+def data_source_stamp():
+    """Tamanho e mtime das entradas do ETL: muda quando chega um arquivo bruto ou lote novo."""
+    if os.path.isdir(RAW_BATCH_DIR):
+        paths = sorted(glob.glob(os.path.join(RAW_BATCH_DIR, '*.csv')))
+    else:
+        paths = [RAW_DATA_PATH] if os.path.exists(RAW_DATA_PATH) else []
+    return tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths)
+
+def shared_data_bytes(data):
+    """Memória (bytes) dos DataFrames e arrays de um dicionário de dados, sem contar repetidos."""
+    seen = set()
+
+    def size(value):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True, deep=True).sum())
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, dict):
+            return sum(size(v) for v in value.values())
+        return 0
+    return size(data)
+
+def _freeze(data):
+    """Marca os arrays dos índices como somente leitura (compartilhados entre sessões)."""
+    for value in data.values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        elif isinstance(value, dict):
+            _freeze(value)
+
+def _publish(data):
+    """Prepara uma nova versão para ser compartilhada entre as sessões."""
+    _freeze(data)
+    register_shared_memory('dados do dashboard', shared_data_bytes(data))
+
+@st.cache_resource
+def get_background_etl():
+    """Atualizador único do processo: serve a última versão boa e roda o ETL em segundo plano."""
+    return BackgroundETL(load_dashboard_data, load_last_good_data, data_source_stamp, on_swap=_publish)
+
+@instrumented
+def load_session_data():
+    """Retorna a versão atual dos dados compartilhados do processo (None se indisponíveis).
+
+    Ninguém deve alterá-los: as sessões só guardam seleções feitas a partir deles.
+
+    Se ainda não há nenhuma versão processada, espera a primeira carga do ETL
+    mostrando o progresso; depois disso, as atualizações não bloqueiam a página.
+    """
+    etl = get_background_etl()
+    data = etl.get()
+    if data is None and etl.status()['running']:
+        bar = st.progress(0.0, text="Carregando os dados...")
+        while data is None and etl.status()['running']:
+            etl.wait(0.5)
+            status = etl.status()
+            bar.progress(status['progress'], text=status['message'])
+            data = etl.get()
+        bar.empty()
+    return data
 
-    return df_filtered
+def data_status(data):
+    """Barra lateral: quando os dados em uso foram processados e o progresso da atualização."""
+    st.sidebar.caption(f"Dados processados em {data['processed_at']:%d/%m/%Y %H:%M}")
+    status = get_background_etl().status()
+    if status['running']:
+        with st.sidebar:
+            _refresh_progress()
+    elif status['error']:
+        st.sidebar.warning(f"A última atualização dos dados falhou: {status['error']}")
+
+@st.fragment(run_every=1)
+def _refresh_progress():
+    """Progresso do ETL em segundo plano; ao terminar, recarrega a página com a nova versão."""
+    status = get_background_etl().status()
+    if not status['running']:
+        st.rerun()
+    st.progress(status['progress'], text=f"Atualizando os dados: {status['message']}")
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_metrics(filters):
+    """Métricas do feed ao vivo (CURRY_LIVE_FEED), atualizadas sem rerun da página.
+
+    Cada atualização processa só as linhas novas do feed e combina o micro-lote
+    aos agregados corridos. Os filtros da barra lateral se aplicam, exceto o
+    período: o feed é o movimento do momento.
+    """
+    feed = get_live_feed()
+    feed.poll()
+    state = feed.state()
+    st.subheader("Ao Vivo")
+    if state['cube'] is None:
+        st.caption(f"Aguardando pedidos no feed {feed.path}...")
+        return
+
+    dates = state['cube']['Order_Date']
+    live_filters = {**filters, 'date_range': (dates.min().date(), dates.max().date())}
+    cube = apply_filters(state['cube'], **live_filters)
+    metrics = get_live_key_metrics(cube, apply_filters(state['deliverers'], **live_filters))
+
+    columns = st.columns(5)
+    for column, (label, key) in zip(columns, [('Pedidos', 'Total Pedidos'),
+                                              ('Entregadores Ativos', 'Total Entregadores Únicos'),
+                                              ('Tempo Médio Entrega (min)', 'Tempo Médio de Entrega (min)'),
+                                              ('Tempo Médio (Festival)', 'Tempo Médio (Festival)'),
+                                              ('Tempo Médio (Não Festival)', 'Tempo Médio (Não Festival)')]):
+        column.metric(label, metrics[key])
+    st.caption(f"{state['orders']} pedidos recebidos do feed ({state['rejected']} descartados na limpeza), "
+               f"atualizado às {state['updated']:%H:%M:%S}")
+    with st.expander("Tempo de entrega por cidade e tráfego (ao vivo)"):
+        st.dataframe(get_live_time_by_city_and_traffic(cube), hide_index=True)
+
+def default_filters(index):
+    """Filtros iniciais da barra lateral: período inteiro e todos os valores (sem 'NaN')."""
+    dates = index['df']['Order_Date'].dropna()
+    filters = {'date_range': (dates.min().date(), dates.max().date())}
+    for arg, col in FILTER_COLUMNS.items():
+        filters[arg] = [v for v in filter_options(None, col, index) if pd.notna(v) and v != 'NaN']
+    return filters
+
+def filter_data(data, filters):
+    """Aplica os filtros aos pedidos, ao cubo, aos sketches e aos histogramas de `data`.
+
+    `data` é o dicionário de load_dashboard_data. Cada seleção é marcada com
+    (versão dos dados, filtros) para o cache de resultados. Com o backend SQL,
+    as seleções são predicados sobre os Parquet, agregados pelo DuckDB.
+    """
+    if sql_backend_enabled() and data.get('parquet_files'):
+        return select_filtered(data['parquet_files'], data['dataset_version'], filters, FILTER_COLUMNS)
+    return filter_in_memory(data, filters)
+
+def filter_in_memory(data, filters):
+    """Seleções de filter_data feitas nos índices em memória (backend pandas), mesmo com o backend SQL ligado."""
+    version = data['dataset_version']
+
+    def select(name, index):
+        return tag_for_cache(apply_filters(index['df'], **filters, index=index), version, filters, name)
+
+    # Filtros que restringem uma dimensão fora das células dos sketches ficam sem
+    # sketch: as contagens de distintos são exatas sobre os pedidos
+    use_sketches = not any(restricts(data['filter_index'], col, filters[arg])
+                           for arg, col in FILTER_COLUMNS.items() if col not in SKETCH_DIMENSIONS)
+    return {
+        'orders': select('orders', data['filter_index']),
+        'cube': select('cube', data['cube_index']),
+        'deliverers': select('deliverers', data['deliverer_index']),
+        'distinct': {col: select(f'distinct_{col}', index)
+                     for col, index in data['sketch_indexes'].items() if use_sketches},
+        'quantiles': select('quantiles', data['quantile_index']),
+    }
+
+def filter_options(df1, col, index=None):
+    """Valores disponíveis para um filtro (lidos do índice, quando existir)."""
+    if index is not None:
+        return list(index['masks'][col].keys())
+    return df1[col].unique().tolist()
+
+# Índice de filtragem
+@instrumented
+def build_filter_index(df):
+    """Constrói, uma única vez após o ETL, o índice usado por apply_filters.
+
+    As linhas são ordenadas por data (um período vira uma fatia via searchsorted)
+    e cada valor de cidade, tráfego, clima e veículo recebe uma máscara booleana
+    (só das colunas presentes: os sketches de distintos não têm todas).
+    """
+    df_sorted = df.sort_values('Order_Date', kind='stable').reset_index(drop=True)
+    masks = {}
+    has_nulls = {}
+    for col in FILTER_COLUMNS.values():
+        if col not in df_sorted.columns:
+            continue
+        codes, uniques = pd.factorize(df_sorted[col], sort=True)
+        masks[col] = {value: codes == i for i, value in enumerate(uniques)}
+        has_nulls[col] = bool((codes == -1).any())
+    return {
+        'df': df_sorted,
+        'dates': df_sorted['Order_Date'].to_numpy(),
+        'masks': masks,
+        'has_nulls': has_nulls,
+    }
+
+def restricts(index, col, values):
+    """Indica se filtrar `col` por `values` exclui linhas do índice (valor não selecionado ou nulo)."""
+    return index['has_nulls'][col] or not set(index['masks'][col]) <= set(values)
+
+def select_rows(index, date_range, traffic, weather, vehicle, cities):
+    """Linhas selecionadas pelos filtros: uma fatia (slice) ou um array de posições.
+
+    Colunas ausentes do índice não são filtradas (ver filter_data).
+    """
+    start = np.datetime64(date_range[0], 'D')
+    end = np.datetime64(date_range[1], 'D') + 1 # Inclui o último dia inteiro
+    lo, hi = index['dates'].searchsorted([start, end], side='left')
+
+    mask = None
+    selections = {'cities': cities, 'traffic': traffic, 'weather': weather, 'vehicle': vehicle}
+    for arg, col in FILTER_COLUMNS.items():
+        if col not in index['masks'] or not restricts(index, col, selections[arg]):
+            continue # Todos os valores selecionados: filtro não restringe nada
+        value_masks = index['masks'][col]
+        selected = [v for v in set(selections[arg]) if v in value_masks]
+        dim_mask = np.zeros(hi - lo, dtype=bool)
+        for value in selected:
+            dim_mask |= value_masks[value][lo:hi]
+        mask = dim_mask if mask is None else np.logical_and(mask, dim_mask, out=mask)
+
+    if mask is None:
+        return slice(lo, hi)
+    return lo + np.flatnonzero(mask)
 
 # Aplicação dos filtros
-def apply_filters(df1, date_range, traffic, weather, vehicle, cities):
-    """Aplica os filtros selecionados pelo usuário ao DataFrame."""
-    if not pd.api.types.is_datetime64_any_dtype(df1['Order_Date']):
-        df1['Order_Date'] = pd.to_datetime(df1['Order_Date'], errors='coerce')
+@instrumented
+def apply_filters(df1, date_range, traffic, weather, vehicle, cities, index=None):
+    """Aplica os filtros selecionados pelo usuário ao DataFrame.
+
+    Com o índice de build_filter_index (df1 deve ser index['df']), a seleção é
+    feita por fatias e máscaras pré-calculadas, sem varrer as colunas, e o
+    retorno é uma seleção de linhas (row_selection): nenhuma coluna é copiada
+    até que um consumidor peça as suas (take_columns).
+    """
+    if index is not None:
+        return row_selection(index['df'], select_rows(index, date_range, traffic, weather, vehicle, cities))
+
+    order_dates = df1['Order_Date']
+    if not pd.api.types.is_datetime64_any_dtype(order_dates):
+        order_dates = pd.to_datetime(order_dates, errors='coerce')
 
+    # A seleção booleana já devolve um DataFrame novo (df1 não é alterado)
     df_filtered = df1[
-        (df1['Order_Date'].dt.date >= date_range[0]) & 
-        (df1['Order_Date'].dt.date <= date_range[1]) & 
+        (order_dates.dt.date >= date_range[0]) & 
+        (order_dates.dt.date <= date_range[1]) & 
         (df1['Road_traffic_density'].isin(traffic)) &
         (df1['Weatherconditions'].isin(weather)) &
         (df1['Type_of_vehicle'].isin(vehicle)) &
         (df1['City'].isin(cities))
-    ].copy()
+    ]
     return df_filtered
\ No newline at end of file
@@ -1,41 +1,236 @@
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 import streamlit as st
-import folium
 import numpy as np
-from streamlit_folium import folium_static
-from math import radians, cos, sin, asin, sqrt
-from folium.plugins import MarkerCluster
-from haversine import haversine, Unit
+# plotly e folium são importados dentro das funções que os usam: a página só paga o
+# import na primeira vez que desenha um gráfico ou mapa
+from src.aggregates import (
+    is_cube, rollup, count_orders, count_distinct, age_groups, AGE_LABELS, ORDERS_COLUMN,
+    stat_columns, take_columns, selection_frame,
+    is_quantile_sketch, build_quantile_sketch, sketch_percentiles, PERCENTILES,
+    build_deliverer_cells, deliverer_profiles, top_bottom_by_group, DELIVERER_BREAKDOWNS,
+    DELIVERER_COLUMN, DELIVERER_DIMENSIONS, DELIVERER_MEASURES, QUANTILE_MEASURE, QUANTILE_BIN_WIDTH,
+    QUANTILE_DIMENSIONS
+)
+from src.query_backend import is_selection, query, query_cube, quote, age_group_sql
+from src.result_cache import memoize_result
+from src.diagnostics import instrumented
+
+# As funções de agregação aceitam o DataFrame de pedidos filtrado ou o cubo de
+# métricas filtrado (src/aggregates.py); com o cubo, nenhuma linha é varrida.
+# Com o backend SQL (src/query_backend.py) recebem a seleção filtrada, e cada
+# agregação vira uma consulta agregada no DuckDB sobre os Parquet processados.
+# Os filtros com índice devolvem seleções de linhas (src/aggregates.py): cada função
+# copia só as colunas que usa (take_columns), nunca o DataFrame inteiro.
+# Com @memoize_result, os resultados de entradas marcadas com tag_for_cache são
+# compartilhados entre páginas e sessões (src/result_cache.py); os auxiliares
+# também são memorizados, então gráficos diferentes reaproveitam o mesmo groupby.
+
+# === AUXILIARES DE AGREGAÇÃO ===
+@memoize_result
+def _mean_std(df, by, measure):
+    """Média e desvio padrão de uma medida por grupo."""
+    if is_selection(df):
+        df = query_cube(df, by, [measure])
+    df = take_columns(df, by + [measure, ORDERS_COLUMN, *stat_columns(measure)])
+    if is_cube(df):
+        return rollup(df, by, measure)[by + ['mean', 'std']]
+    return df.groupby(by, observed=True)[measure].agg(['mean', 'std']).reset_index()
+
+@memoize_result
+def _mean(df, measure, where=None):
+    """Média de uma medida, opcionalmente restrita às linhas em que coluna == valor."""
+    if is_selection(df):
+        return rollup(query_cube(df, [], [measure], where=where), [], measure)['mean'].iloc[0]
+    df = take_columns(df, [measure, ORDERS_COLUMN, *stat_columns(measure)] + ([where[0]] if where else []))
+    if where is not None:
+        col, value = where
+        df = df[df[col] == value]
+    if is_cube(df):
+        return rollup(df, [], measure)['mean'].iloc[0]
+    return df[measure].mean()
+
+@memoize_result
+def _count_orders(df, by):
+    """Número de pedidos por grupo (coluna 'ID')."""
+    if is_selection(df):
+        df = query_cube(df, by, [])
+    df = take_columns(df, by + ['ID', ORDERS_COLUMN])
+    if is_cube(df):
+        return count_orders(df, by).reset_index(name='ID')
+    return df.groupby(by, observed=True)['ID'].count().reset_index()
+
+def _total_orders(df):
+    """Número total de pedidos, exato (soma das células do cubo, se for o cubo)."""
+    if is_selection(df):
+        return int(query(df, [f"count({quote('ID')})"]).iloc[0, 0])
+    df = take_columns(df, ['ID', ORDERS_COLUMN])
+    if is_cube(df):
+        return int(df[ORDERS_COLUMN].sum())
+    return int(df['ID'].count())
+
+def _count_distinct(df, column, sketch=None):
+    """Distintos de uma coluna e o erro relativo (exato em SQL; ver count_distinct)."""
+    if is_selection(df):
+        return int(query(df, [f"count(DISTINCT {quote(column)})"]).iloc[0, 0]), 0.0
+    return count_distinct(df, column, sketch)
+
+def _min_max(df, column):
+    """Menor e maior valor de uma coluna."""
+    if is_selection(df):
+        row = query(df, [f"min({quote(column)})", f"max({quote(column)})"]).iloc[0]
+        # Seleção vazia: NaN, como no pandas
+        return tuple(np.nan if pd.isna(v) else v for v in row)
+    values = take_columns(df, [column])[column]
+    return values.min(), values.max()
+
+def _value_counts(df, column):
+    """Valores de uma coluna e seus pesos: em SQL, os distintos e suas contagens; senão as linhas (pesos None)."""
+    if is_selection(df):
+        counts = query(df, [quote(column), 'count(*)'], group_by=[quote(column)], where=[f"{quote(column)} IS NOT NULL"])
+        return counts.iloc[:, 0], counts.iloc[:, 1]
+    return take_columns(df, [column])[column], None
+
+# === AUXILIARES DE GRÁFICOS ===
+# Os gráficos recebem contagens já agregadas no servidor (np.histogram / np.bincount):
+# o JSON enviado ao navegador depende do número de barras ou pontos, e não do
+# número de pedidos. Nenhum traço passa de MAX_POINTS_PER_TRACE pontos.
+MAX_POINTS_PER_TRACE = 500
+# Larguras "redondas" das faixas de histograma (x 10^k)
+NICE_BIN_STEPS = (1, 2, 2.5, 5, 10)
+
+def nice_bin_width(span, nbins):
+    """Menor largura redonda que cobre `span` em no máximo nbins faixas."""
+    if not span > 0:
+        return 1.0
+    raw = span / nbins
+    magnitude = 10.0 ** np.floor(np.log10(raw))
+    return next(step * magnitude for step in NICE_BIN_STEPS if step * magnitude >= raw)
+
+def histogram_counts(values, nbins, weights=None):
+    """Contagens por faixa (início, fim, contagem), com bordas em múltiplos de uma largura redonda.
+
+    Com `weights`, cada valor conta o seu peso (valores distintos já contados).
+    """
+    values = np.asarray(values, dtype='float64')
+    finite = np.isfinite(values)
+    values = values[finite]
+    if weights is not None:
+        weights = np.asarray(weights, dtype='int64')[finite]
+    if not len(values):
+        return pd.DataFrame({'start': [], 'end': [], 'count': []})
+    low, high = values.min(), values.max()
+    width = nice_bin_width(high - low, min(nbins, MAX_POINTS_PER_TRACE))
+    start = np.floor(low / width) * width
+    # Arredonda o ruído de ponto flutuante das bordas (ex.: 2.4000000000000004)
+    edges = np.round(start + width * np.arange(int((high - start) // width) + 2), 10)
+    counts, _ = np.histogram(values, bins=edges, weights=weights)
+    counts = counts.astype('int64')
+    return pd.DataFrame({'start': edges[:-1], 'end': edges[1:], 'count': counts})
+
+def downsample_dates(dates, counts, max_points=MAX_POINTS_PER_TRACE):
+    """Soma contagens diárias em períodos de N dias, com no máximo max_points períodos.
+
+    Retorna (início de cada período com pedidos, contagens, N).
+    """
+    days = pd.to_datetime(dates).to_numpy().astype('datetime64[D]')
+    counts = np.asarray(counts, dtype='int64')
+    if not len(days):
+        return days, counts, 1
+    first = days.min()
+    offsets = (days - first).astype('int64')
+    step = max(1, -(-(int(offsets.max()) + 1) // max_points)) # Divisão com arredondamento para cima
+    buckets = offsets // step
+    totals = np.bincount(buckets, weights=counts).astype('int64')
+    occupied = np.flatnonzero(np.bincount(buckets))
+    return first + occupied * step, totals[occupied], step
+
+def _histogram_figure(bins, title, x_title, y_title):
+    """Histograma desenhado a partir de contagens por faixa (uma barra por faixa)."""
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Bar(
+        x=((bins['start'] + bins['end']) / 2).to_numpy(), y=bins['count'].to_numpy(),
+        width=(bins['end'] - bins['start']).to_numpy(),
+        customdata=bins[['start', 'end']].to_numpy(),
+        hovertemplate='%{customdata[0]:.4g} – %{customdata[1]:.4g}: %{y}<extra></extra>'
+    ))
+    fig.update_layout(title=title, xaxis_title=x_title, yaxis_title=y_title, bargap=0)
+    return fig
+
+def distinct_label(label, error):
+    """Rótulo de uma contagem de distintos, com o erro relativo quando é uma estimativa."""
+    return f"{label} (±{error:.1%})" if error else label
 
 # === VISÃO EMPRESA ===
-def get_company_key_metrics(df):
-    """Dicionário com métricas-chave para a visão da empresa."""
-    metrics = {}
-    metrics['Total Pedidos'] = df['ID'].nunique()
-    metrics['Total Entregadores Únicos'] = df['Delivery_person_ID'].nunique()
-    metrics['Tempo Médio de Entrega (min)'] = round(df['Time_taken(min)'].mean(), 2)
-
-    festival_time = df[df['Festival'] == 'Yes']['Time_taken(min)'].mean()
+@instrumented
+@memoize_result
+def get_company_key_metrics(df, cube=None, sketches=None):
+    """Dicionário com métricas-chave para a visão da empresa.
+
+    O total de pedidos é exato (somado no cubo). Com `sketches` ({coluna: sketch
+    filtrado}), seleções grandes usam HyperLogLog na contagem de entregadores;
+    o erro relativo de cada contagem fica em 'Erro Relativo'.
+    """
+    agg = cube if cube is not None else df
+    sketches = sketches or {}
+    metrics = {'Erro Relativo': {'Total Pedidos': 0.0}}
+    metrics['Total Pedidos'] = _total_orders(agg)
+    metrics['Total Entregadores Únicos'], metrics['Erro Relativo']['Total Entregadores Únicos'] = \
+        _count_distinct(df, 'Delivery_person_ID', sketches.get('Delivery_person_ID'))
+    metrics['Tempo Médio de Entrega (min)'] = round(_mean(agg, 'Time_taken(min)'), 2)
+
+    festival_time = _mean(agg, 'Time_taken(min)', where=('Festival', 'Yes'))
     metrics["Tempo Médio (Festival)"] = round(festival_time, 2) if pd.notna(festival_time) else "N/A"
 
-    non_festival_time = df[df['Festival'] == 'No']['Time_taken(min)'].mean()
+    non_festival_time = _mean(agg, 'Time_taken(min)', where=('Festival', 'No'))
     metrics["Tempo Médio (Não Festival)"] = round(non_festival_time, 2) if pd.notna(non_festival_time) else "N/A"
 
     return metrics
 
+@instrumented
+def get_live_key_metrics(cube, deliverers):
+    """Métricas-chave da visão da empresa a partir dos agregados corridos do feed ao vivo.
+
+    Mesmas chaves de get_company_key_metrics; pedidos e entregadores são contados
+    nas células do cubo e por entregador, sem varrer os pedidos.
+    """
+    metrics = {'Erro Relativo': {'Total Pedidos': 0.0, 'Total Entregadores Únicos': 0.0}}
+    metrics['Total Pedidos'] = int(cube[ORDERS_COLUMN].sum())
+    metrics['Total Entregadores Únicos'] = deliverers.loc[deliverers[ORDERS_COLUMN] > 0, DELIVERER_COLUMN].nunique()
+    mean_time = _mean(cube, 'Time_taken(min)')
+    metrics['Tempo Médio de Entrega (min)'] = round(mean_time, 2) if pd.notna(mean_time) else "N/A"
+    for label, value in (("Tempo Médio (Festival)", 'Yes'), ("Tempo Médio (Não Festival)", 'No')):
+        festival_time = _mean(cube, 'Time_taken(min)', where=('Festival', value))
+        metrics[label] = round(festival_time, 2) if pd.notna(festival_time) else "N/A"
+    return metrics
+
+@instrumented
+def get_live_time_by_city_and_traffic(cube):
+    """Pedidos, tempo médio e desvio padrão por cidade e tráfego (agregados corridos do feed)."""
+    df_aux = rollup(cube, ['City', 'Road_traffic_density'], 'Time_taken(min)')
+    df_aux.columns = ['Cidade', 'Densidade de Tráfego', 'Pedidos', 'Tempo Médio (min)', 'STD Tempo (min)']
+    return df_aux.round(2)
+
+@instrumented
+@memoize_result
 def plot_orders_by_date(df):
     """Volume de pedidos por data."""
-    df_aux = df.groupby('Order_Date')['ID'].count().reset_index()
+    import plotly.express as px
+    df_aux = _count_orders(df, ['Order_Date'])
+    # Séries longas: os dias são somados em períodos de N dias (no máximo MAX_POINTS_PER_TRACE barras)
+    dates, counts, step = downsample_dates(df_aux['Order_Date'], df_aux['ID'])
+    df_aux = pd.DataFrame({'Order_Date': dates, 'ID': counts})
+    title = 'Volume de Pedidos por Data' if step == 1 else f'Volume de Pedidos por Período de {step} Dias'
     fig = px.bar(df_aux, x='Order_Date', y='ID',
-                 title='Volume de Pedidos por Data',
+                 title=title,
                  labels={'Order_Date': 'Data do Pedido', 'ID': 'Número de Pedidos'})
     return fig
 
+@instrumented
+@memoize_result
 def plot_traffic_order_share(df):
     """Distribuição de pedidos por densidade de tráfego."""
-    df_aux = df.groupby('Road_traffic_density')['ID'].count().reset_index()
+    import plotly.express as px
+    df_aux = _count_orders(df, ['Road_traffic_density'])
     df_aux = df_aux.loc[df_aux['Road_traffic_density'] != "NaN", :].copy()
     df_aux['Percentual'] = df_aux['ID'] / df_aux['ID'].sum()
 
@@ -44,18 +239,31 @@ def plot_traffic_order_share(df):
                  color_discrete_sequence=px.colors.qualitative.Plotly)
     return fig
 
+@instrumented
+@memoize_result
 def plot_traffic_order_city(df):
     """Volume de pedidos por cidade e densidade de tráfego."""
-    df_aux = df.groupby(['City', 'Road_traffic_density'])['ID'].count().reset_index()
+    import plotly.express as px
+    df_aux = _count_orders(df, ['City', 'Road_traffic_density'])
     fig = px.scatter(df_aux, x='City', y='Road_traffic_density', size='ID', color='City',
                      title='Volume de Pedidos por Cidade e Densidade de Tráfego',
                      labels={'City': 'Cidade', 'Road_traffic_density': 'Densidade de Tráfego', 'ID': 'Número de Pedidos'})
     return fig
 
+@instrumented
 def get_country_map(df):
     """Localizações medianas de entrega agrupadas por cidade e densidade de tráfego."""
-    df_aux = df.dropna(subset=['Delivery_location_latitude', 'Delivery_location_longitude']).copy()
-    df_aux = df_aux.groupby(['City', 'Road_traffic_density'])[['Delivery_location_latitude', 'Delivery_location_longitude']].median().reset_index()
+    import folium
+    from folium.plugins import MarkerCluster
+    by = ['City', 'Road_traffic_density']
+    coords = ['Delivery_location_latitude', 'Delivery_location_longitude']
+    if is_selection(df):
+        df_aux = query(df, [quote(c) for c in by] + [f"median({quote(c)}) AS {quote(c)}" for c in coords],
+                       group_by=[quote(c) for c in by],
+                       where=[f"{quote(c)} IS NOT NULL" for c in by + coords])
+    else:
+        df_aux = take_columns(df, by + coords).dropna(subset=coords)
+        df_aux = df_aux.groupby(by, observed=True)[coords].median().reset_index()
 
     # Define um centro inicial para o mapa
     if not df_aux.empty:
@@ -78,18 +286,25 @@ def get_country_map(df):
 
     return map_obj
 
+@instrumented
+@memoize_result
 def plot_order_types_distribution(df):
     """Distribuição dos tipos de pedido."""
-    df_aux = df['Type_of_order'].value_counts(normalize=True).reset_index()
+    import plotly.express as px
+    df_aux = _count_orders(df, ['Type_of_order']).sort_values('ID', ascending=False)
+    df_aux['ID'] = df_aux['ID'] / df_aux['ID'].sum()
     df_aux.columns = ['Tipo de Pedido', 'Percentual']
     fig = px.pie(df_aux, values='Percentual', names='Tipo de Pedido',
                  title='Distribuição dos Tipos de Pedido',
                  color_discrete_sequence=px.colors.qualitative.Pastel)
     return fig
 
+@instrumented
+@memoize_result
 def plot_time_by_order_type_and_traffic(df):
     """Tempo médio de entrega por tipo de pedido e densidade de tráfego."""
-    df_aux = df.groupby(['Type_of_order', 'Road_traffic_density'])['Time_taken(min)'].mean().reset_index()
+    import plotly.express as px
+    df_aux = _mean_std(df, ['Type_of_order', 'Road_traffic_density'], 'Time_taken(min)').drop(columns='std')
     df_aux.columns = ['Tipo de Pedido', 'Densidade de Tráfego', 'Tempo Médio (min)']
 
     fig = px.bar(df_aux, x='Tipo de Pedido', y='Tempo Médio (min)',
@@ -98,65 +313,286 @@ def plot_time_by_order_type_and_traffic(df):
                  labels={'Tipo de Pedido': 'Tipo de Pedido', 'Tempo Médio (min)': 'Tempo (min)'})
     return fig
 
+# === MAPA DE DENSIDADE ===
+# Todos os pedidos são agregados no servidor em uma grade lat/lon: o mapa recebe
+# um polígono por célula ocupada, então o tamanho do HTML depende do número de
+# células (e não do número de pedidos). A célula encolhe à medida que o zoom aumenta.
+DENSITY_POINTS = {
+    'delivery': ('Delivery_location_latitude', 'Delivery_location_longitude', 'Locais de entrega'),
+    'restaurant': ('Restaurant_latitude', 'Restaurant_longitude', 'Restaurantes'),
+}
+# Células por largura de tile (256 px): cerca de 32 px por célula em qualquer zoom
+DENSITY_CELLS_PER_TILE = 8
+DENSITY_DEFAULT_ZOOM = 4
+DENSITY_COLORS = ['#ffffb2', '#fecc5c', '#fd8d3c', '#f03b20', '#bd0026']
+
+def density_cell_size(zoom):
+    """Lado da célula da grade (graus) para um nível de zoom do mapa."""
+    return 360.0 / (2 ** int(zoom) * DENSITY_CELLS_PER_TILE)
+
+@instrumented
+@memoize_result
+def bin_coordinates(df, points, cell_deg, bounds=None):
+    """Número de pedidos por célula da grade (vetorizado), opcionalmente só dentro de `bounds`.
+
+    `bounds` é (sul, oeste, norte, leste); coordenadas nulas ou (0, 0) são ignoradas.
+    """
+    lat_col, lon_col, _ = DENSITY_POINTS[points]
+    if is_selection(df):
+        return _bin_coordinates_sql(df, lat_col, lon_col, cell_deg, bounds)
+    df = take_columns(df, [lat_col, lon_col])
+    lat = df[lat_col].to_numpy(dtype='float64', na_value=np.nan)
+    lon = df[lon_col].to_numpy(dtype='float64', na_value=np.nan)
+    valid = ~(np.isnan(lat) | np.isnan(lon)) & ~((lat == 0) & (lon == 0))
+    if bounds is not None:
+        south, west, north, east = bounds
+        valid &= (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+
+    rows = np.floor((lat[valid] + 90) / cell_deg).astype('int64')
+    cols = np.floor((lon[valid] + 180) / cell_deg).astype('int64')
+    n_cols = int(np.ceil(360 / cell_deg)) + 1
+    cells, counts = np.unique(rows * n_cols + cols, return_counts=True)
+    return pd.DataFrame({'row': cells // n_cols, 'col': cells % n_cols, 'count': counts})
+
+def _bin_coordinates_sql(selection, lat_col, lon_col, cell_deg, bounds):
+    """bin_coordinates como consulta agregada (mesma aritmética em float64)."""
+    lat, lon = f"CAST({quote(lat_col)} AS DOUBLE)", f"CAST({quote(lon_col)} AS DOUBLE)"
+    where = [f"{lat} IS NOT NULL", f"{lon} IS NOT NULL", f"NOT ({lat} = 0 AND {lon} = 0)"]
+    params = []
+    if bounds is not None:
+        where.append(f"{lat} BETWEEN ? AND ? AND {lon} BETWEEN ? AND ?")
+        south, west, north, east = bounds
+        params = [south, north, west, east]
+    cell = f"CAST({cell_deg!r} AS DOUBLE)"
+    cells = [f"CAST(floor(({lat} + 90) / {cell}) AS BIGINT)", f"CAST(floor(({lon} + 180) / {cell}) AS BIGINT)"]
+    bins = query(selection, [f"{cells[0]} AS row", f"{cells[1]} AS col", 'count(*) AS count'],
+                 group_by=cells, where=where, params=params)
+    return bins.astype('int64')
+
+def density_geojson(bins, cell_deg):
+    """FeatureCollection com um retângulo por célula, cor por log(contagem)."""
+    south = bins['row'].to_numpy() * cell_deg - 90
+    west = bins['col'].to_numpy() * cell_deg - 180
+    counts = bins['count'].to_numpy()
+    # Escala logarítmica: poucas células muito densas não apagam as demais
+    levels = np.log1p(counts)
+    top = levels.max() if len(levels) else 1.0
+    color_idx = np.minimum((levels / top * len(DENSITY_COLORS)).astype('int64'), len(DENSITY_COLORS) - 1)
+
+    features = [{
+        'type': 'Feature',
+        'geometry': {'type': 'Polygon', 'coordinates': [[
+            [w, s], [w + cell_deg, s], [w + cell_deg, s + cell_deg], [w, s + cell_deg], [w, s]
+        ]]},
+        'properties': {'count': int(c), 'color': DENSITY_COLORS[i]},
+    } for s, w, c, i in zip(south.tolist(), west.tolist(), counts.tolist(), color_idx.tolist())]
+    return {'type': 'FeatureCollection', 'features': features}
+
+def padded_bounds(bounds, factor=1.0):
+    """Amplia os limites da vista em `factor` vezes o seu tamanho para cada lado."""
+    south, west, north, east = bounds
+    lat_pad = (north - south) * factor
+    lon_pad = (east - west) * factor
+    return (max(south - lat_pad, -90.0), max(west - lon_pad, -180.0),
+            min(north + lat_pad, 90.0), min(east + lon_pad, 180.0))
+
+def density_view_from_map(view, map_state):
+    """Nova vista {'zoom', 'center', 'bounds'} se o usuário mudou o zoom ou deslocou o mapa; senão None.
+
+    `map_state` é o retorno do st_folium (zoom, center e bounds do navegador).
+    """
+    if not map_state or map_state.get('zoom') is None or not map_state.get('bounds'):
+        return None
+    sw, ne = map_state['bounds']['_southWest'], map_state['bounds']['_northEast']
+    center = map_state.get('center')
+    if sw.get('lat') is None or ne.get('lat') is None or not center:
+        return None
+    new_view = {'zoom': int(map_state['zoom']), 'center': [center['lat'], center['lng']],
+                'bounds': (sw['lat'], sw['lng'], ne['lat'], ne['lng'])}
+
+    if new_view['zoom'] != view['zoom']:
+        return new_view
+    if view['bounds'] is None:
+        return None # Vista inicial sem recorte: todas as células já estão no mapa
+    # Deslocamento maior que 1/4 da vista: recentraliza o recorte
+    south, west, north, east = new_view['bounds']
+    moved = (abs(new_view['center'][0] - view['center'][0]) > (north - south) / 4 or
+             abs(new_view['center'][1] - view['center'][1]) > (east - west) / 4)
+    return new_view if moved else None
+
+@instrumented
+def get_density_map(df, zoom=DENSITY_DEFAULT_ZOOM, center=None, bounds=None):
+    """Mapa de densidade de todos os locais de entrega e restaurantes, agregados em grade."""
+    import folium
+    cell_deg = density_cell_size(zoom)
+    # Com a vista conhecida, só as células próximas dela são enviadas
+    clip = padded_bounds(bounds) if bounds is not None else None
+
+    if center is None and is_selection(df):
+        lat_col, lon_col, _ = DENSITY_POINTS['delivery']
+        lat, lon = quote(lat_col), quote(lon_col)
+        row = query(df, [f"median({lat})", f"median({lon})", 'count(*)'],
+                    where=[f"{lat} IS NOT NULL", f"{lon} IS NOT NULL", f"({lat} != 0 OR {lon} != 0)"]).iloc[0]
+        center = [float(row.iloc[0]), float(row.iloc[1])] if row.iloc[2] else [0, 0]
+    elif center is None:
+        lat_col, lon_col, _ = DENSITY_POINTS['delivery']
+        coords = take_columns(df, [lat_col, lon_col])[[lat_col, lon_col]].dropna()
+        coords = coords[(coords[lat_col] != 0) | (coords[lon_col] != 0)]
+        center = [coords[lat_col].median(), coords[lon_col].median()] if not coords.empty else [0, 0]
+
+    map_obj = folium.Map(location=center, zoom_start=zoom, prefer_canvas=True)
+    for i, (points, (_, _, label)) in enumerate(DENSITY_POINTS.items()):
+        bins = bin_coordinates(df, points, cell_deg, clip)
+        folium.GeoJson(
+            density_geojson(bins, cell_deg),
+            name=f"{label} ({len(bins)} células)",
+            show=(i == 0), # Restaurantes: camada opcional no controle de camadas
+            style_function=lambda feature: {
+                'fillColor': feature['properties']['color'],
+                'color': feature['properties']['color'],
+                'weight': 0.5,
+                'fillOpacity': 0.6,
+            },
+            tooltip=folium.GeoJsonTooltip(fields=['count'], aliases=['Pedidos:']),
+        ).add_to(map_obj)
+    folium.LayerControl(collapsed=False).add_to(map_obj)
+    return map_obj
+
 # === VISÃO ENTREGADORES ===
-def get_delivery_key_metrics(df):
+@instrumented
+@memoize_result
+def get_delivery_key_metrics(df, cube=None, sketches=None):
     """Dicionário com métricas-chave para a visão de entregadores."""
-    metrics = {}
-    metrics['Idade Máxima'] = int(df['Delivery_person_Age'].max())
-    metrics['Idade Mínima'] = int(df['Delivery_person_Age'].min())
-    metrics['Melhor Condição Veículo'] = df['Vehicle_condition'].max() # Supondo que 0=pior, N=melhor
-    metrics['Pior Condição Veículo'] = df['Vehicle_condition'].min() # Supondo que 0=pior, N=melhor
-    metrics['Total Entregadores Únicos'] = df['Delivery_person_ID'].nunique()
-    metrics['Média Avaliação Entregadores'] = round(df['Delivery_person_Ratings'].mean(), 2)
+    agg = cube if cube is not None else df
+    sketches = sketches or {}
+    metrics = {'Erro Relativo': {}}
+    min_age, max_age = _min_max(df, 'Delivery_person_Age')
+    metrics['Idade Máxima'] = int(max_age)
+    metrics['Idade Mínima'] = int(min_age)
+    worst, best = _min_max(agg, 'Vehicle_condition') # Supondo que 0=pior, N=melhor
+    metrics['Melhor Condição Veículo'] = best
+    metrics['Pior Condição Veículo'] = worst
+    metrics['Total Entregadores Únicos'], metrics['Erro Relativo']['Total Entregadores Únicos'] = \
+        _count_distinct(df, 'Delivery_person_ID', sketches.get('Delivery_person_ID'))
+    metrics['Média Avaliação Entregadores'] = round(float(_mean(agg, 'Delivery_person_Ratings')), 2)
     return metrics
 
+@instrumented
+@memoize_result
 def get_delivery_rating_by_traffic(df):
     """Avaliação média e desvio padrão dos entregadores por densidade de tráfego."""
-    df_aux = df.groupby('Road_traffic_density')['Delivery_person_Ratings'].agg(['mean', 'std']).reset_index()
+    df_aux = _mean_std(df, ['Road_traffic_density'], 'Delivery_person_Ratings')
     df_aux.columns = ['Densidade de Tráfego', 'Média Avaliação', 'STD Avaliação']
     return df_aux
 
+@instrumented
+@memoize_result
 def get_delivery_rating_by_weather(df):
     """Avaliação média e desvio padrão dos entregadores por condição climática."""
-    df_aux = df.groupby('Weatherconditions')['Delivery_person_Ratings'].agg(['mean', 'std']).reset_index()
+    df_aux = _mean_std(df, ['Weatherconditions'], 'Delivery_person_Ratings')
     df_aux.columns = ['Condição Climática', 'Média Avaliação', 'STD Avaliação']
     return df_aux
 
+@instrumented
+@memoize_result
 def get_top_n_deliverers(df, top_n=10, ascending=True):
     """Identifica os top N (ou piores N) entregadores com base no tempo médio de entrega por cidade."""
     # Agrupa por cidade e entregador, calcula o tempo médio
-    df_aux = df.groupby(['City', 'Delivery_person_ID'])['Time_taken(min)'].mean().reset_index()
+    df = take_columns(df, ['City', 'Delivery_person_ID', 'Time_taken(min)'])
+    df_aux = df.groupby(['City', 'Delivery_person_ID'], observed=True)['Time_taken(min)'].mean().reset_index()
     df_aux.columns = ['City', 'Delivery_person_ID', 'Avg_Time_taken(min)']
 
     # Ordena e seleciona o top N por cidade
     df_aux = df_aux.sort_values(['City', 'Avg_Time_taken(min)'], ascending=ascending)
-    result = df_aux.groupby('City').head(top_n).reset_index(drop=True)
+    result = df_aux.groupby('City', observed=True).head(top_n).reset_index(drop=True)
     return result
 
+def _avg_time_by_city_and_deliverer(df):
+    """Tempo médio por cidade e entregador (ordenado por cidade), das células por entregador ou dos pedidos."""
+    if is_selection(df):
+        df = query_cube(df, ['City', 'Delivery_person_ID'], ['Time_taken(min)'])
+    df = take_columns(df, ['City', 'Delivery_person_ID', 'Time_taken(min)', ORDERS_COLUMN,
+                           *stat_columns('Time_taken(min)')])
+    if is_cube(df):
+        df_aux = rollup(df, ['City', 'Delivery_person_ID'], 'Time_taken(min)')[['City', 'Delivery_person_ID', 'mean']]
+    else:
+        df_aux = df.groupby(['City', 'Delivery_person_ID'], observed=True)['Time_taken(min)'].mean().reset_index()
+    df_aux.columns = ['City', 'Delivery_person_ID', 'Avg_Time_taken(min)']
+    return df_aux.dropna(subset=['Avg_Time_taken(min)']).reset_index(drop=True)
+
+@instrumented
+@memoize_result
+def get_fastest_and_slowest_deliverers(df, top_n=10):
+    """Os N entregadores mais rápidos e os N mais lentos de cada cidade, em uma única passada.
+
+    Aceita as células por entregador filtradas (ou os pedidos filtrados); cada
+    tabela tem o mesmo formato de get_top_n_deliverers.
+    """
+    df_aux = _avg_time_by_city_and_deliverer(df)
+    # O groupby ordena por cidade: cada cidade é um bloco contíguo de linhas
+    city_codes, _ = pd.factorize(df_aux['City'])
+    lowest, highest = top_bottom_by_group(df_aux['Avg_Time_taken(min)'].to_numpy(), city_codes, top_n)
+    fastest = df_aux.iloc[lowest].reset_index(drop=True)
+    # Como em get_top_n_deliverers(ascending=False), as cidades vêm em ordem decrescente
+    highest = highest[np.argsort(-city_codes[highest], kind='stable')]
+    slowest = df_aux.iloc[highest].reset_index(drop=True)
+    return fastest, slowest
+
+@instrumented
+@memoize_result
+def get_deliverer_profiles(df):
+    """Tabela de perfis indexada por Delivery_person_ID (das células por entregador ou dos pedidos)."""
+    if is_selection(df):
+        # Só o entregador e as dimensões das quebras do perfil
+        cells = query_cube(df, [DELIVERER_COLUMN, *DELIVERER_BREAKDOWNS], DELIVERER_MEASURES)
+    elif is_cube(selection_frame(df)):
+        cells = take_columns(df, [DELIVERER_COLUMN, *DELIVERER_BREAKDOWNS, ORDERS_COLUMN,
+                                  *(col for measure in DELIVERER_MEASURES for col in stat_columns(measure))])
+    else:
+        cells = build_deliverer_cells(take_columns(df, DELIVERER_DIMENSIONS + DELIVERER_MEASURES))
+    return deliverer_profiles(cells)
+
+def get_deliverer_profile(profiles, deliverer_id):
+    """Perfil de um entregador: consulta O(1) no índice da tabela de perfis."""
+    row = profiles.loc[deliverer_id]
+    std = row['time_std']
+    profile = {
+        'Pedidos': int(row['orders']),
+        'Tempo Médio (min)': round(float(row['time_mean']), 2),
+        'STD Tempo (min)': round(float(std), 2) if pd.notna(std) else "N/A",
+        'Avaliação Média': round(float(row['rating_mean']), 2) if pd.notna(row['rating_mean']) else "N/A",
+    }
+    for col, prefix in DELIVERER_BREAKDOWNS.items():
+        values = row[[c for c in profiles.columns if c.startswith(f'time_mean|{prefix}=')]].dropna()
+        profile[col] = pd.DataFrame({
+            'Condição': [c.split('=', 1)[1] for c in values.index],
+            'Tempo Médio (min)': values.astype('float64').round(2).to_numpy(),
+        })
+    return profile
+
+@instrumented
+@memoize_result
 def plot_delivery_age_distribution(df):
     """Distribuição de idade dos entregadores."""
-    fig = px.histogram(df.dropna(subset=['Delivery_person_Age']), x='Delivery_person_Age',
-                       title='Distribuição de Idade dos Entregadores',
-                       labels={'Delivery_person_Age': 'Idade do Entregador'},
-                       nbins=20 # Número de barras no histograma
-                      )
-    fig.update_layout(xaxis_title='Idade', yaxis_title='Número de Entregadores')
-    return fig
+    values, counts = _value_counts(df, 'Delivery_person_Age')
+    bins = histogram_counts(values, nbins=20, weights=counts) # Número de barras no histograma
+    return _histogram_figure(bins, 'Distribuição de Idade dos Entregadores', 'Idade', 'Número de Entregadores')
 
+@instrumented
+@memoize_result
 def plot_delivery_ratings_distribution(df):
     """Distribuição de avaliações dos entregadores."""
-    fig = px.histogram(df.dropna(subset=['Delivery_person_Ratings']), x='Delivery_person_Ratings',
-                       title='Distribuição de Avaliações dos Entregadores',
-                       labels={'Delivery_person_Ratings': 'Avaliação'},
-                       nbins=10, # Avaliações geralmente de 1 a 5, então umas 10 bins deve ser bom
-                       color_discrete_sequence=px.colors.qualitative.Plotly
-                      )
-    fig.update_layout(xaxis_title='Avaliação', yaxis_title='Frequência')
-    return fig
+    # Avaliações geralmente de 1 a 5, então umas 10 bins deve ser bom
+    values, counts = _value_counts(df, 'Delivery_person_Ratings')
+    bins = histogram_counts(values, nbins=10, weights=counts)
+    return _histogram_figure(bins, 'Distribuição de Avaliações dos Entregadores', 'Avaliação', 'Frequência')
 
+@instrumented
+@memoize_result
 def plot_time_taken_by_vehicle_condition(df):
     """Tempo médio de entrega por condição do veículo."""
-    df_aux = df.groupby('Vehicle_condition')['Time_taken(min)'].agg(['mean', 'std']).reset_index()
+    import plotly.graph_objects as go
+    df_aux = _mean_std(df, ['Vehicle_condition'], 'Time_taken(min)')
     df_aux.columns = ['Condição do Veículo', 'Tempo Médio (min)', 'STD Tempo (min)']
 
     fig = go.Figure()
@@ -171,16 +607,29 @@ def plot_time_taken_by_vehicle_condition(df):
     )
     return fig
 
+@instrumented
+@memoize_result
 def plot_deliveries_by_age_group_and_city(df):
     """Número de entregadores por faixa etária e por cidade"""
-    df_temp = df.dropna(subset=['Delivery_person_Age', 'City']).copy()
-    # Criar faixas etárias (ex: 18-25, 26-35, etc.)
-    bins = [18, 25, 35, 45, 55, 65]
-    labels = ['18-25', '26-35', '36-45', '46-55', '56-65']
-    df_temp['Age_Group'] = pd.cut(df_temp['Delivery_person_Age'], bins=bins, labels=labels, right=False)
-
-    df_aux = df_temp.groupby(['City', 'Age_Group'])['Delivery_person_ID'].nunique().reset_index()
+    import plotly.express as px
+    if is_selection(df):
+        age_group = age_group_sql('Delivery_person_Age')
+        df_aux = query(df, [quote('City'), age_group, f"count(DISTINCT {quote('Delivery_person_ID')})"],
+                       group_by=[quote('City'), age_group],
+                       where=[f"{quote('City')} IS NOT NULL", f"{age_group} IS NOT NULL"])
+    else:
+        df_temp = take_columns(df, ['Delivery_person_Age', 'City', 'Delivery_person_ID'])
+        df_temp = df_temp.dropna(subset=['Delivery_person_Age', 'City']).copy()
+        # Criar faixas etárias (ex: 18-25, 26-35, etc.)
+        df_temp['Age_Group'] = age_groups(df_temp['Delivery_person_Age'])
+        df_aux = df_temp.groupby(['City', 'Age_Group'], observed=True)['Delivery_person_ID'].nunique().reset_index()
     df_aux.columns = ['City', 'Age_Group', 'Unique_Deliverers']
+    # Todas as faixas etárias de cada cidade aparecem, com 0 onde não há entregadores
+    groups = pd.MultiIndex.from_product([sorted(df_aux['City'].unique()), AGE_LABELS], names=['City', 'Age_Group'])
+    df_aux = (df_aux.astype({'City': str, 'Age_Group': str})
+                    .set_index(['City', 'Age_Group'])['Unique_Deliverers']
+                    .reindex(groups, fill_value=0)
+                    .reset_index())
 
     fig = px.bar(df_aux, x='Age_Group', y='Unique_Deliverers', color='City',
                  title='Número de Entregadores Únicos por Faixa Etária e Cidade',
@@ -188,37 +637,41 @@ def plot_deliveries_by_age_group_and_city(df):
     return fig
 
 # === VISÃO RESTAURANTES ===
-def get_restaurant_key_metrics(df):
+@instrumented
+@memoize_result
+def get_restaurant_key_metrics(df, cube=None, sketches=None):
     """Calcula e retorna um dicionário com métricas-chave para a visão de restaurantes."""
-    metrics = {}
+    agg = cube if cube is not None else df
+    sketches = sketches or {}
+    metrics = {'Erro Relativo': {}}
 
     # 1. Quantidade de entregadores únicos
-    metrics["Entregadores Únicos"] = df['Delivery_person_ID'].nunique()
-
-    # 2. Distância média entre restaurantes e locais de entrega
-    df_valid_coords = df.dropna(subset=['Restaurant_latitude', 'Restaurant_longitude',
-                                       'Delivery_location_latitude', 'Delivery_location_longitude']).copy()
-    if not df_valid_coords.empty:
-        df_valid_coords['distance'] = df_valid_coords.apply(lambda x:
-            haversine((x['Restaurant_latitude'], x['Restaurant_longitude']),
-                      (x['Delivery_location_latitude'], x['Delivery_location_longitude']), unit=Unit.KILOMETERS), axis=1)
-        metrics["Distância Média (km)"] = round(df_valid_coords['distance'].mean(), 2)
+    metrics["Entregadores Únicos"], metrics['Erro Relativo']["Entregadores Únicos"] = \
+        _count_distinct(df, 'Delivery_person_ID', sketches.get('Delivery_person_ID'))
+
+    # 2. Distância média entre restaurantes e locais de entrega (pré-calculada no ETL)
+    mean_distance = _mean(agg, 'distance_km')
+    if pd.notna(mean_distance):
+        metrics["Distância Média (km)"] = round(float(mean_distance), 2)
     else:
         metrics["Distância Média (km)"] = "N/A (Dados de localização insuficientes)"
 
     # 3. Tempo médio de entrega durante os Festivais
-    festival_time = df[df['Festival'] == 'Yes']['Time_taken(min)'].mean()
+    festival_time = _mean(agg, 'Time_taken(min)', where=('Festival', 'Yes'))
     metrics["Tempo Médio (Festival)"] = round(festival_time, 2) if pd.notna(festival_time) else "N/A"
 
     # 4. Tempo Médio de Entrega Fora de Festivais
-    non_festival_time = df[df['Festival'] == 'No']['Time_taken(min)'].mean()
+    non_festival_time = _mean(agg, 'Time_taken(min)', where=('Festival', 'No'))
     metrics["Tempo Médio (Não Festival)"] = round(non_festival_time, 2) if pd.notna(non_festival_time) else "N/A"
 
     return metrics
 
+@instrumented
+@memoize_result
 def plot_avg_std_time_by_city(df):
     """Tempo médio e desvio padrão do tempo de entrega por cidade."""
-    df_aux = df.groupby('City')['Time_taken(min)'].agg(['mean', 'std']).reset_index()
+    import plotly.graph_objects as go
+    df_aux = _mean_std(df, ['City'], 'Time_taken(min)')
     fig = go.Figure()
     fig.add_trace(go.Bar(x=df_aux['City'], y=df_aux['mean'],
                          error_y=dict(type='data', array=df_aux['std']),
@@ -231,15 +684,20 @@ def plot_avg_std_time_by_city(df):
     )
     return fig
 
+@instrumented
+@memoize_result
 def get_avg_std_time_by_city_and_order_type(df):
     """Tempo médio e desvio padrão de entrega por cidade e por tipo de pedido."""
-    df_aux = df.groupby(['City', 'Type_of_order'])['Time_taken(min)'].agg(['mean', 'std']).reset_index()
+    df_aux = _mean_std(df, ['City', 'Type_of_order'], 'Time_taken(min)')
     df_aux.columns = ['City', 'Type_of_order', 'Avg_Time(min)', 'Std_Time(min)']
     return df_aux
 
+@instrumented
+@memoize_result
 def plot_avg_std_time_by_city_and_traffic(df):
     """Tempo médio de entrega por cidade e densidade de tráfego, com a cor indicando o desvio padrão."""
-    df_aux = df.groupby(['City', 'Road_traffic_density'])['Time_taken(min)'].agg(['mean', 'std']).reset_index()
+    import plotly.express as px
+    df_aux = _mean_std(df, ['City', 'Road_traffic_density'], 'Time_taken(min)')
     df_aux.columns = ['City', 'Road_traffic_density', 'Avg_Time(min)', 'Std_Time(min)']
 
     fig = px.sunburst(df_aux, path=['City', 'Road_traffic_density'], values='Avg_Time(min)',
@@ -249,26 +707,73 @@ def plot_avg_std_time_by_city_and_traffic(df):
                       title='Tempo Médio e Desvio Padrão de Entrega por Cidade e Tráfego')
     return fig
 
+@instrumented
+@memoize_result
 def plot_distance_by_vehicle_type(df):
     """Distância média de entrega por tipo de veículo e retorna um gráfico de barras."""
-    df_valid_coords = df.dropna(subset=['Restaurant_latitude', 'Restaurant_longitude',
-                                       'Delivery_location_latitude', 'Delivery_location_longitude']).copy()
-    if df_valid_coords.empty:
+    import plotly.express as px
+    import plotly.graph_objects as go
+    df_aux = _mean_std(df, ['Type_of_vehicle'], 'distance_km').dropna(subset=['mean'])
+    if df_aux.empty:
         return go.Figure().add_annotation(text="Sem dados válidos para cálculo de distância.",
                                           xref="paper", yref="paper", showarrow=False)
 
-    df_valid_coords['distance'] = df_valid_coords.apply(lambda x:
-        haversine((x['Restaurant_latitude'], x['Restaurant_longitude']),
-                  (x['Delivery_location_latitude'], x['Delivery_location_longitude']), unit=Unit.KILOMETERS), axis=1)
-
-    df_aux = df_valid_coords.groupby('Type_of_vehicle')['distance'].mean().reset_index()
+    df_aux = df_aux[['Type_of_vehicle', 'mean']]
+    df_aux.columns = ['Type_of_vehicle', 'distance']
     fig = px.bar(df_aux, x='Type_of_vehicle', y='distance',
                  title='Distância Média de Entrega por Tipo de Veículo',
                  labels={'Type_of_vehicle': 'Tipo de Veículo', 'distance': 'Distância Média (km)'})
     return fig
 
+@instrumented
+@memoize_result
 def get_avg_rating_by_weather_condition(df):
     """Avaliação média dos entregadores por condição climática."""
-    df_aux = df.groupby('Weatherconditions')['Delivery_person_Ratings'].agg(['mean', 'std']).reset_index()
-    df_aux.columns = ['Condição Climática', 'Avaliação Média', 'STD Avaliação']
-    return df_aux
+    # Mesmo agrupamento da visão de entregadores: reaproveita o resultado em cache
+    return get_delivery_rating_by_weather(df).rename(columns={'Média Avaliação': 'Avaliação Média'})
+
+# === PERCENTIS DO TEMPO DE ENTREGA (SLA) ===
+# Dimensões disponíveis para os percentis e seus rótulos
+PERCENTILE_DIMENSIONS = {
+    'City': 'Cidade',
+    'Road_traffic_density': 'Densidade de Tráfego',
+    'Type_of_vehicle': 'Tipo de Veículo',
+}
+
+@instrumented
+@memoize_result
+def get_time_percentiles(df, by=None):
+    """Percentis p50/p90/p99 do tempo de entrega (min), no total ou por grupo.
+
+    Aceita o sketch de quantis filtrado (combinação de histogramas, sem ordenar
+    os pedidos) ou o DataFrame de pedidos filtrado.
+    """
+    if is_selection(df):
+        # Histograma do tempo por grupo calculado no DuckDB (mesmo formato do sketch)
+        cols = [quote(col) for col in by or []]
+        bin_expr = f"CAST(floor(CAST({quote(QUANTILE_MEASURE)} AS DOUBLE) / CAST({QUANTILE_BIN_WIDTH!r} AS DOUBLE)) AS INTEGER)"
+        sketch = query(df, cols + [f"{bin_expr} AS bin", 'count(*) AS count'], group_by=cols + [bin_expr],
+                       where=[f"{quote(QUANTILE_MEASURE)} IS NOT NULL"])
+    elif is_quantile_sketch(selection_frame(df)):
+        sketch = take_columns(df, [*(by or []), 'bin', 'count'])
+    else:
+        sketch = build_quantile_sketch(take_columns(df, QUANTILE_DIMENSIONS + [QUANTILE_MEASURE]))
+    return sketch_percentiles(sketch, by=by)
+
+@instrumented
+@memoize_result
+def plot_time_percentiles(df, by):
+    """Percentis do tempo de entrega por cidade, tráfego ou veículo."""
+    import plotly.graph_objects as go
+    df_aux = get_time_percentiles(df, by=[by])
+    fig = go.Figure()
+    for p in PERCENTILES:
+        fig.add_trace(go.Bar(x=df_aux[by], y=df_aux[f'p{p}'], name=f'p{p}'))
+    fig.update_layout(
+        title=f'Percentis do Tempo de Entrega por {PERCENTILE_DIMENSIONS[by]}',
+        xaxis_title=PERCENTILE_DIMENSIONS[by],
+        yaxis_title='Tempo (min)',
+        barmode='group',
+        hovermode="x unified"
+    )
+    return fig